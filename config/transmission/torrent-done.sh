@@ -0,0 +1,21 @@
+#!/bin/sh
+# Transmission calls this script right after a torrent finishes downloading.
+# It notifies kuzgun.io so the torrent gets finished without waiting for the next poll.
+# linuxserver/transmission is based on Alpine, which ships BusyBox wget but not
+# necessarily curl, so curl is only used if it's installed.
+
+[ -z "$TORRENT_DONE_TOKEN" ] && exit 0
+
+URL=http://app:8000/api/torrents/done/
+
+if command -v curl > /dev/null; then
+  curl -s -m 10 -X POST \
+    -H "X-Torrent-Done-Token: $TORRENT_DONE_TOKEN" \
+    -d "hash=$TR_TORRENT_HASH" \
+    "$URL" > /dev/null
+else
+  wget -q -T 10 -O /dev/null \
+    --header "X-Torrent-Done-Token: $TORRENT_DONE_TOKEN" \
+    --post-data "hash=$TR_TORRENT_HASH" \
+    "$URL"
+fi
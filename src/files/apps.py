@@ -6,3 +6,6 @@ class FilesConfig(AppConfig):
     App config for files app.
     """
     name = 'files'
+
+    def ready(self):
+        from . import signals  # noqa
@@ -33,11 +33,15 @@ class File(TimeStampedModel):
     def __init__(self, *args, **kwargs):
         """
         Set name, ext and content_type (if possible) automatically initialize by path.
+        Only objects which are created with a path derive them. Objects loaded from
+        the database are initialized with positional values, so they keep the stored ones.
         """
         super(File, self).__init__(*args, **kwargs)
-        pieces = os.path.splitext(os.path.basename(str(self.path)))
-        self.name, self.ext = pieces[0], pieces[1][1:]
-        self.content_type = mimetypes.guess_type(self.full_path)[0]
+
+        if 'path' in kwargs:
+            pieces = os.path.splitext(os.path.basename(str(self.path)))
+            self.name, self.ext = pieces[0], pieces[1][1:]
+            self.content_type = mimetypes.guess_type(self.full_path)[0]
 
     def __str__(self):
         return '{} (#{})'.format(self.file_name, self.pk)
@@ -82,15 +86,26 @@ class File(TimeStampedModel):
     def mp4_status(self):
         """
         Returns file:{pk}:mp4_status hash from redis if set and a MP4 file.
+        Fetched once per object, unless it's loaded by load_mp4_statuses.
 
         :return: dict|bool
         """
         if self.ext != 'mp4':
             return False
 
-        data = redis.hgetall(MP4_STATUS_HASH.format(self.pk))
+        if not hasattr(self, '_mp4_status'):
+            self.set_mp4_status(redis.hgetall(MP4_STATUS_HASH.format(self.pk)))
+
+        return self._mp4_status
 
-        return {
+    def set_mp4_status(self, data):
+        """
+        Sets mp4_status by MP4_STATUS_HASH data of the file.
+
+        :param data: dict
+        :return: None
+        """
+        self._mp4_status = {
             'duration': int(data.get('duration', 0)),
             'progress': data.get('progress', '0.00'),
         } if data else False
@@ -1,12 +1,30 @@
+from django.db.models import Manager
 from rest_framework import serializers
 
+from kuzgun.serializers import DynamicFieldsMixin
 from kuzgun.utils import enum_to_dict
 from .models import File
+from .utils import load_mp4_statuses
 
 
-class FileSerializer(serializers.ModelSerializer):
+class FileListSerializer(serializers.ListSerializer):
+    """
+    List serializer class of the File model.
+    Fetches mp4_status of the whole page from redis in one pipeline before serializing it.
+    """
+    def to_representation(self, data):
+        files = list(data.all() if isinstance(data, Manager) else data)
+
+        if 'mp4_status' in self.child.fields:
+            load_mp4_statuses(files)
+
+        return super(FileListSerializer, self).to_representation(files)
+
+
+class FileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer class of the File model.
+    Supports `fields` query parameter.
     """
     volume = serializers.SerializerMethodField()
     mp4_status = serializers.SerializerMethodField()
@@ -14,6 +32,7 @@ class FileSerializer(serializers.ModelSerializer):
     class Meta:
         model = File
         fields = '__all__'
+        list_serializer_class = FileListSerializer
 
     def get_volume(self, obj):
         """
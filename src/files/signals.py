@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from kuzgun.utils import bump_user_versions_on_commit
+from .models import File
+
+
+@receiver(post_save, sender=File)
+def bump_versions_on_save(**kwargs):
+    """
+    Bumps version stamps of the users of the saved file (e.g. MP4 file gets its size).
+    Files don't have any user right after they are created.
+    """
+    if not kwargs['created']:
+        bump_user_versions_on_commit(kwargs['instance'].user_set.values_list('pk', flat=True))
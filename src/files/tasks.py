@@ -8,13 +8,32 @@ from subprocess import Popen, STDOUT, PIPE
 from celery.utils.log import get_task_logger
 
 from kuzgun.celery import app
-from kuzgun.utils import redis
+from kuzgun.utils import publish_events, redis
 from torrents.models import Torrent
 from .models import File, MP4_STATUS_HASH
 
 logger = get_task_logger(__name__)
 
 
+def publish_mp4_status(user_ids, f_mp4, duration, progress):
+    """
+    Publishes mp4_status of the MP4 file object to the users as a `file` event.
+
+    :param user_ids: list of user PKs
+    :param f_mp4: File object
+    :param duration: int
+    :param progress: str
+    :return: None
+    """
+    publish_events([(user_ids, 'file', {
+        'id': f_mp4.pk,
+        'mp4_status': {
+            'duration': duration,
+            'progress': progress,
+        },
+    })])
+
+
 @app.task
 def convert_to_mp4(file_id, **kwargs):
     """
@@ -44,6 +63,10 @@ def convert_to_mp4(file_id, **kwargs):
     duration = (int(hours) * 3600) + (int(minutes) * 60) + int(seconds)
     redis.hset(MP4_STATUS_HASH.format(f_mp4.pk), 'duration', duration)
 
+    user_ids = list(f.user_set.values_list('pk', flat=True))
+    progress = '0.00'
+    publish_mp4_status(user_ids, f_mp4, duration, progress)
+
     output_options = {
         'mkv': '-vcodec copy -acodec copy -ac 2 -ab 128k -crf 23',
         'avi': '-vcodec libx264 -acodec aac -ac 2 -ab 128k -crf 23'
@@ -65,11 +88,15 @@ def convert_to_mp4(file_id, **kwargs):
         if time_search:
             hours, minutes, seconds = time_search.group().split(b'=')[1].split(b':')
             time_seconds = (int(hours) * 3600) + (int(minutes) * 60) + int(seconds)
-            redis.hset(
-                MP4_STATUS_HASH.format(f_mp4.pk), 'progress', '{:.2f}'.format((time_seconds * 100) / duration)
-            )
+            current_progress = '{:.2f}'.format((time_seconds * 100) / duration)
+
+            if current_progress != progress:
+                progress = current_progress
+                redis.hset(MP4_STATUS_HASH.format(f_mp4.pk), 'progress', progress)
+                publish_mp4_status(user_ids, f_mp4, duration, progress)
 
     redis.hset(MP4_STATUS_HASH.format(f_mp4.pk), 'progress', '100.00')
+    publish_mp4_status(user_ids, f_mp4, duration, '100.00')
 
     f_mp4.set_size()
     f_mp4.save()
@@ -0,0 +1,139 @@
+"""
+Benchmarks of the files app. They are skipped unless BENCHMARKS environment
+variable is set, since they create tens of thousands of rows:
+
+    $ BENCHMARKS=1 python manage.py test files.tests.test_benchmarks
+
+Query counts are asserted exactly per batch. Timings are asserted relative to
+the previous implementations, so they don't depend on the machine.
+"""
+
+import math
+import mimetypes
+import os
+import time
+from unittest import skipUnless
+
+from django.db import connection, reset_queries
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..enums import Volume
+from ..models import File
+from ..utils import create_from_torrent, BATCH_SIZE
+
+BENCHMARKS = os.environ.get('BENCHMARKS')
+FILE_COUNT = 10000
+ROUNDS = 3
+BULK_SPEEDUP = 4  # create_from_torrent must be at least that many times faster than creating one by one
+
+
+class SyntheticTorrent(object):
+    """
+    Transmission torrent object stand-in with file_count files.
+    """
+    def __init__(self, name, file_count):
+        self.name = name
+        self.file_count = file_count
+
+    def files(self):
+        return {
+            i: {
+                'name': '{}/Season {:02d}/{}.E{:05d}.mkv'.format(self.name, i // 100, self.name, i),
+                'size': 1024 * 1024 * (i % 700 + 1),
+                'completed': 0,
+                'priority': 'normal',
+                'selected': True,
+            } for i in range(self.file_count)
+        }
+
+
+def create_from_torrent_one_by_one(torrent):
+    """
+    Previous implementation of create_from_torrent to compare with.
+    """
+    files = set()
+
+    for _, item in torrent.files().items():
+        f, _ = File.objects.get_or_create(
+            volume=Volume.TORRENT,
+            path=item['name'],
+            defaults={'size': item['size']},
+        )
+        files.add(f)
+
+    return files
+
+
+def derive_from_path(f):
+    """
+    Previous File.__init__ which derived name, ext and content_type of every object.
+    """
+    pieces = os.path.splitext(os.path.basename(str(f.path)))
+    f.name, f.ext = pieces[0], pieces[1][1:]
+    f.content_type = mimetypes.guess_type(f.full_path)[0]
+
+
+@skipUnless(BENCHMARKS, 'Set BENCHMARKS environment variable to run benchmarks.')
+class FileBenchmarks(TestCase):
+    """
+    Benchmarks of file utils.
+    """
+    def _benchmark(self, func, *args):
+        """
+        Runs func and measures it.
+
+        :return: tuple: result of func, number of queries and elapsed seconds.
+        """
+        reset_queries()  # Captured queries are wrong once the query log of the connection is full.
+
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            result = func(*args)
+            elapsed = time.perf_counter() - start
+
+        return result, len(context.captured_queries), elapsed
+
+    def test_create_from_torrent(self):
+        batches = math.ceil(FILE_COUNT / BATCH_SIZE)
+
+        # Query log of the previous implementation would overflow, it is only timed.
+        start = time.perf_counter()
+        files = create_from_torrent_one_by_one(SyntheticTorrent('Before', FILE_COUNT))
+        one_by_one_elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(files), FILE_COUNT)
+
+        # Lookup, insert and reload queries per batch, savepoint and its release.
+        files, queries, elapsed = self._benchmark(create_from_torrent, SyntheticTorrent('After', FILE_COUNT))
+
+        self.assertEqual(len(files), FILE_COUNT)
+        self.assertEqual(queries, batches * 3 + 2)
+        self.assertLess(elapsed * BULK_SPEEDUP, one_by_one_elapsed)
+
+        files, queries, _ = self._benchmark(create_from_torrent, SyntheticTorrent('After', FILE_COUNT))
+
+        self.assertEqual(len(files), FILE_COUNT)
+        self.assertEqual(queries, batches)
+
+    def test_iterate_files(self):
+        create_from_torrent(SyntheticTorrent('Iterate', FILE_COUNT))
+        elapsed = {}
+
+        for func in (derive_from_path, None):
+            timings = []
+
+            for _ in range(ROUNDS):
+                start = time.perf_counter()
+                files = list(File.objects.iterator())
+
+                if func is not None:
+                    for f in files:
+                        func(f)
+
+                timings.append(time.perf_counter() - start)
+                self.assertEqual(len(files), FILE_COUNT)
+
+            elapsed[func] = min(timings)
+
+        self.assertLess(elapsed[None], elapsed[derive_from_path])
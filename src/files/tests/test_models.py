@@ -1,10 +1,12 @@
 import os
 import time
 
+from unittest.mock import patch
+
 from django.test import TestCase
 
 from ..enums import Volume
-from ..models import File
+from ..models import File, MP4_STATUS_HASH
 
 
 class FileModelTests(TestCase):
@@ -51,6 +53,18 @@ class FileModelTests(TestCase):
         self.assertFalse(f.exists_on_disk())
         self.assertFalse(f.mp4_status)
 
+    def test_load_object_that_keep_stored_columns(self):
+        f = File.objects.create(volume=Volume.DATA, path='drop.avi')
+        File.objects.filter(pk=f.pk).update(name='renamed', content_type='video/avi')
+
+        with patch('files.models.mimetypes.guess_type') as mock_guess_type:
+            f = File.objects.get(pk=f.pk)
+
+        self.assertEqual(f.name, 'renamed')
+        self.assertEqual(f.ext, 'avi')
+        self.assertEqual(f.content_type, 'video/avi')
+        mock_guess_type.assert_not_called()
+
     def test_create_object_sized_zero_and_set_size(self):
         name = '{}-sample'.format(int(time.time()))
         txt_file = open('/{}/{}.txt'.format(Volume.DATA.value, name), 'w+')
@@ -68,3 +82,12 @@ class FileModelTests(TestCase):
 
         self.assertGreater(f.size, 0)
         os.remove('/{}/{}.txt'.format(Volume.DATA.value, name))
+
+    @patch('files.models.redis.hgetall')
+    def test_mp4_status_that_fetched_once(self, mock_hgetall):
+        mock_hgetall.return_value = {'duration': '5400', 'progress': '45.97'}
+        f = File(volume=Volume.DATA, path='drop.mp4')
+
+        self.assertDictEqual(f.mp4_status, {'duration': 5400, 'progress': '45.97'})
+        self.assertEqual(f.mp4_status['progress'], '45.97')
+        mock_hgetall.assert_called_once_with(MP4_STATUS_HASH.format(f.pk))
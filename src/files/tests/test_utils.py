@@ -2,8 +2,9 @@ from unittest.mock import patch
 
 from django.test import TestCase
 
+from files.enums import Volume
 from files.models import File
-from ..utils import create_from_torrent
+from ..utils import create_from_torrent, load_mp4_statuses
 
 
 class FileUtilTests(TestCase):
@@ -30,3 +31,67 @@ class FileUtilTests(TestCase):
 
         for file in files:
             self.assertIsInstance(file, File)
+
+    @patch('torrents.utils.transmission')
+    def test_create_from_torrent_that_file_exists(self, mock_instance):
+        f = File.objects.create(
+            volume=Volume.TORRENT, path='The.Quick.Brown/The quick brown fox jumps over the lazy dog.jpg'
+        )
+
+        mock_instance.files.return_value = {
+            0: {
+                'name': 'The.Quick.Brown/The quick brown fox jumps over the lazy dog.jpg',
+                'size': 8827
+            },
+            1: {
+                'name': 'The.Quick.Brown/The quick brown fox jumps over the lazy dog.avi',
+                'size': 2802579083
+            }
+        }
+
+        files = create_from_torrent(mock_instance)
+
+        self.assertEqual(len(files), 2)
+        self.assertIn(f, files)
+        self.assertEqual(File.objects.filter(path__startswith='The.Quick.Brown/').count(), 2)
+
+    @patch('torrents.utils.transmission')
+    def test_create_from_torrent_that_bulk_create_does_not_set_pks(self, mock_instance):
+        bulk_create = File.objects.bulk_create
+
+        def bulk_create_without_pks(objs, **kwargs):
+            created = bulk_create(objs, **kwargs)
+
+            for f in created:
+                f.pk = None
+
+            return created
+
+        mock_instance.files.return_value = {
+            0: {'name': 'The.Quick.Brown/The quick brown fox jumps over the lazy dog.jpg', 'size': 8827},
+            1: {'name': 'The.Quick.Brown/The quick brown fox jumps over the lazy dog.avi', 'size': 2802579083},
+        }
+
+        with patch.object(File.objects, 'bulk_create', side_effect=bulk_create_without_pks):
+            files = create_from_torrent(mock_instance)
+
+        self.assertSetEqual(files, set(File.objects.filter(path__startswith='The.Quick.Brown/')))
+        self.assertEqual(len(files), 2)
+
+    @patch('files.utils.redis.pipeline')
+    def test_load_mp4_statuses(self, mock_pipeline):
+        files = [
+            File.objects.create(volume=Volume.DATA, path='drop.mp4'),
+            File.objects.create(volume=Volume.DATA, path='drop.avi'),
+            File.objects.create(volume=Volume.DATA, path='sample.mp4'),
+        ]
+        mock_pipeline.return_value.execute.return_value = [{'duration': '5400', 'progress': '100.00'}, {}]
+
+        load_mp4_statuses(files)
+        load_mp4_statuses(files)
+
+        mock_pipeline.assert_called_once_with(transaction=False)
+        self.assertEqual(mock_pipeline.return_value.hgetall.call_count, 2)
+        self.assertDictEqual(files[0].mp4_status, {'duration': 5400, 'progress': '100.00'})
+        self.assertFalse(files[1].mp4_status)
+        self.assertFalse(files[2].mp4_status)
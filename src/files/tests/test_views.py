@@ -1,8 +1,11 @@
+import json
 from decimal import Decimal
 from unittest.mock import patch
 
 from django.core.files import File as DjangoFile
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
@@ -10,6 +13,7 @@ from rest_framework.test import APITestCase, APIClient
 from torrents.models import Torrent
 from ..enums import Volume
 from ..models import File, FILE_HASH
+from ..tasks import publish_mp4_status
 
 
 class FileViewSetTests(APITestCase):
@@ -50,9 +54,76 @@ class FileViewSetTests(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsNotNone(response.data.get('count'))
+        self.assertNotIn('count', response.data)
         self.assertIsNotNone(response.data.get('results'))
 
+        response = self.client.get(url, {'count': 'true'})
+        self.assertEqual(response.data['count'], 2)
+
+    def test_list_files_that_answer_not_modified(self):
+        url = reverse('files:file-list')
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Conversion progress is published to the users and bumps their version stamps.
+        publish_mp4_status([self.user.pk], self.file_mp4, 60, '50.00')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_torrent_files(self):
+        url = reverse('torrents:torrent-file-list', args=[self.torrent.pk])
+        response = self.client.get(url, {'limit': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([item['id'] for item in response.data['results']], [self.file_mp4.pk])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_list_torrent_files_that_stream(self):
+        url = reverse('torrents:torrent-file-list', args=[self.torrent.pk])
+
+        response = self.client.get(url, {'stream': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertListEqual([row['id'] for row in rows], [self.file_mp4.pk, self.file.pk])
+
+        response = self.client.get(url, {'stream': 'json'})
+        rows = json.loads(b''.join(response.streaming_content).decode())
+        self.assertListEqual([row['id'] for row in rows], [self.file_mp4.pk, self.file.pk])
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        return len(context.captured_queries)
+
+    # TestCase never commits, so the version stamps are bumped right away.
+    @patch('kuzgun.utils.transaction.on_commit', side_effect=lambda func: func())
+    def test_list_files_that_query_count_is_fixed(self, mock_on_commit):
+        urls = [reverse('files:file-list'), reverse('torrents:torrent-file-list', args=[self.torrent.pk])]
+        query_counts = [self._count_queries(url) for url in urls]
+
+        self.torrent.files.add(*[
+            File.objects.create(volume=Volume.DATA, path='drop.{}.mp4'.format(i)) for i in range(10)
+        ])
+
+        self.assertListEqual([self._count_queries(url) for url in urls], query_counts)
+
+    def test_retrieve_torrent_file(self):
+        self.torrent.finished = True
+        self.torrent.save()
+        url = reverse('torrents:torrent-file-detail', args=[self.torrent.pk, self.file.pk])
+
+        # Torrent is checked in the same query as the file.
+        self.assertEqual(
+            self._count_queries(url), self._count_queries(reverse('files:file-detail', args=[self.file.pk]))
+        )
+
     def test_convert_endpoint_that_return_not_available(self):
         file = File.objects.create(volume=Volume.DATA, path='sample.txt')
         self.user.files.add(file)
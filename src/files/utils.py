@@ -1,6 +1,26 @@
-from .models import File
+from django.db import IntegrityError, transaction
+
+from kuzgun.utils import redis
+from .models import File, MP4_STATUS_HASH
 from .enums import Volume
 
+BATCH_SIZE = 1000  # paths per query
+
+
+def get_by_paths(paths):
+    """
+    Get file objects of the paths with one query per BATCH_SIZE paths.
+
+    :param paths: list of paths
+    :return: set
+    """
+    files = set()
+
+    for i in range(0, len(paths), BATCH_SIZE):
+        files.update(File.objects.filter(path__in=paths[i:i + BATCH_SIZE]))
+
+    return files
+
 
 def create_from_torrent(torrent):
     """
@@ -8,21 +28,36 @@ def create_from_torrent(torrent):
     Returns list of file objects so we can use it for something
     different purposes. For example: torrent.files.add(*files)
 
+    Existing files are looked up with one query per BATCH_SIZE paths
+    and the rest are created with bulk_create. Created files are loaded
+    by their paths again, since only PostgreSQL sets the PKs of bulk
+    created objects.
+
     :param torrent: Transmission torrent object
     :return: set
     """
-    files = set()
+    sizes = {item['name']: item['size'] for item in torrent.files().values()}
+    files = get_by_paths(list(sizes))
+    existing_paths = {f.path for f in files}
+    new_files = [
+        File(volume=Volume.TORRENT, path=path, size=size) for path, size in sizes.items() if path not in existing_paths
+    ]
 
-    for _, item in torrent.files().items():
-        path = item['name']
+    if not new_files:
+        return files
 
-        f, _ = File.objects.get_or_create(
-            volume=Volume.TORRENT,
-            path=path,
-            defaults={'size': item['size']},
-        )
+    try:
+        with transaction.atomic():
+            File.objects.bulk_create(new_files, batch_size=BATCH_SIZE)
+    except IntegrityError:
+        # Some of the files are created concurrently (e.g. the same files of another torrent).
+        for new_file in new_files:
+            File.objects.get_or_create(path=new_file.path, defaults={
+                'volume': Volume.TORRENT,
+                'size': new_file.size,
+            })
 
-        files.add(f)
+    files.update(get_by_paths([f.path for f in new_files]))
 
     return files
 
@@ -38,3 +73,25 @@ def handle_uploaded_file(uploaded_file_obj, full_path):
     with open(full_path, 'wb+') as destination:
         for chunk in uploaded_file_obj.chunks():
             destination.write(chunk)
+
+
+def load_mp4_statuses(files):
+    """
+    Fetches mp4_status of the MP4 file objects which aren't loaded yet
+    from redis in one round trip and sets them on the objects.
+
+    :param files: iterable of File objects
+    :return: None
+    """
+    files = [f for f in files if f.ext == 'mp4' and not hasattr(f, '_mp4_status')]
+
+    if not files:
+        return
+
+    pipe = redis.pipeline(transaction=False)
+
+    for f in files:
+        pipe.hgetall(MP4_STATUS_HASH.format(f.pk))
+
+    for f, data in zip(files, pipe.execute()):
+        f.set_mp4_status(data)
@@ -1,7 +1,11 @@
+import json
 import os
 from hashlib import sha1
+from itertools import islice
 
-from django.http import HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.http import http_date
 from django.utils.text import slugify
@@ -13,6 +17,8 @@ from rest_framework.viewsets import GenericViewSet
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
+from kuzgun.mixins import CachedResponseMixin
+from kuzgun.pagination import IdCursorPagination
 from kuzgun.utils import unix_time_millis, redis
 from torrents.models import Torrent
 from .enums import Volume
@@ -25,15 +31,24 @@ from .utils import handle_uploaded_file
 # Current supports: MKV, AVI.
 VIDEO_EXTENSIONS = ('mkv', 'avi')
 
+# Streaming formats of the torrent files listing.
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+STREAM_CHUNK_SIZE = 500  # files serialized at once
 
-class FileViewSet(NestedViewSetMixin, RetrieveModelMixin, ListModelMixin, GenericViewSet):
+
+class FileViewSet(CachedResponseMixin, NestedViewSetMixin, RetrieveModelMixin, ListModelMixin, GenericViewSet):
     """
     File API endpoint for File model. (/files).
     Supported methods: Retrieve, List
     """
     queryset = File.objects.all()
     serializer_class = FileSerializer
+    pagination_class = IdCursorPagination
     parser_classes = (FileUploadParser,)
+    cache_timeout = 60  # seconds, caps the changes which don't bump the version stamp.
 
     def get_queryset(self):
         """
@@ -43,9 +58,29 @@ class FileViewSet(NestedViewSetMixin, RetrieveModelMixin, ListModelMixin, Generi
         """
         return self.request.user.files.all()
 
+    def get_torrent_file(self, queryset, parent_lookup_torrent):
+        """
+        Gets the file of the torrent from queryset along with `torrent_finished`
+        and `torrent_progress` of the torrent in a single query.
+
+        :param queryset: File QuerySet
+        :param parent_lookup_torrent: PK of Torrent object
+        :return: File object
+        """
+        queryset = queryset.filter(torrent__pk=parent_lookup_torrent).annotate(
+            torrent_finished=F('torrent__finished'),
+            torrent_progress=F('torrent__progress'),
+        )
+        obj = get_object_or_404(queryset, pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, obj)
+
+        return obj
+
     def list(self, request, parent_lookup_torrent=None, *args, **kwargs):
         """
         Lists files of the user.
+        Files of the torrent are paginated like files of the user, or streamed
+        without pagination if `stream` query parameter is `json` or `ndjson`.
 
         :return: Response
         """
@@ -53,12 +88,50 @@ class FileViewSet(NestedViewSetMixin, RetrieveModelMixin, ListModelMixin, Generi
         if parent_lookup_torrent:
             # List files of the torrent.
             torrent = get_object_or_404(Torrent, pk=parent_lookup_torrent)
-            serializer = self.serializer_class(torrent.files.all(), many=True)
+            queryset = torrent.files.order_by('-id')
+            stream_format = request.query_params.get('stream')
 
-            return Response(serializer.data)
+            if stream_format in STREAM_CONTENT_TYPES:
+                return StreamingHttpResponse(
+                    self.stream(queryset, stream_format), content_type=STREAM_CONTENT_TYPES[stream_format]
+                )
+
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+
+            return self.get_paginated_response(serializer.data)
 
         return super(FileViewSet, self).list(request, *args, **kwargs)
 
+    def stream(self, queryset, stream_format):
+        """
+        Serializes files of the queryset by STREAM_CHUNK_SIZE rows as they are read
+        from a server-side cursor. Yields a JSON array or one JSON object per line (NDJSON).
+
+        :param queryset: File QuerySet
+        :param stream_format: `json` or `ndjson`
+        :return: generator
+        """
+        separator = stream_format == 'json' and ',' or '\n'
+        files, first = queryset.iterator(), True
+
+        if stream_format == 'json':
+            yield '['
+
+        while True:
+            chunk = list(islice(files, STREAM_CHUNK_SIZE))
+
+            if not chunk:
+                break
+
+            rows = separator.join(
+                json.dumps(item, cls=DjangoJSONEncoder) for item in self.get_serializer(chunk, many=True).data
+            )
+            yield (not first and separator or '') + rows
+            first = False
+
+        yield stream_format == 'json' and ']' or '\n'
+
     def retrieve(self, request, parent_lookup_torrent=None, *args, **kwargs):
         """
         Retrieve a file of the user.
@@ -68,15 +141,14 @@ class FileViewSet(NestedViewSetMixin, RetrieveModelMixin, ListModelMixin, Generi
 
         if parent_lookup_torrent:
             # Retrieve a file of the torrent.
-            torrent = get_object_or_404(Torrent, pk=parent_lookup_torrent)
-            if not torrent.finished:
+            file_obj = self.get_torrent_file(File.objects.all(), parent_lookup_torrent)
+            if not file_obj.torrent_finished:
                 return Response({
                     'detail': "The torrent hasn't finished downloading yet.",
-                    'progress': torrent.progress
+                    'progress': file_obj.torrent_progress
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            file_obj = get_object_or_404(File, torrent__pk=parent_lookup_torrent, pk=kwargs.get('pk'))
-            serializer = self.serializer_class(file_obj)
+            serializer = self.get_serializer(file_obj)
 
             return Response(serializer.data)
 
@@ -93,14 +165,14 @@ class FileViewSet(NestedViewSetMixin, RetrieveModelMixin, ListModelMixin, Generi
         """
 
         if parent_lookup_torrent:
-            torrent = get_object_or_404(Torrent, pk=parent_lookup_torrent)
-            if not torrent.finished:
+            obj = self.get_torrent_file(self.get_queryset(), parent_lookup_torrent)
+            if not obj.torrent_finished:
                 return Response({
                     'detail': "The torrent hasn't finished downloading yet.",
-                    'progress': torrent.progress
+                    'progress': obj.torrent_progress
                 }, status=status.HTTP_400_BAD_REQUEST)
-
-        obj = self.get_object()
+        else:
+            obj = self.get_object()
 
         if obj.ext not in VIDEO_EXTENSIONS:
             return Response({'detail': "Conversion not available for this file."}, status=status.HTTP_400_BAD_REQUEST)
@@ -146,14 +218,14 @@ class FileViewSet(NestedViewSetMixin, RetrieveModelMixin, ListModelMixin, Generi
         """
 
         if parent_lookup_torrent:
-            torrent = get_object_or_404(Torrent, pk=parent_lookup_torrent)
-            if not torrent.finished:
+            obj = self.get_torrent_file(self.get_queryset(), parent_lookup_torrent)
+            if not obj.torrent_finished:
                 return Response({
                     'detail': "The torrent hasn't finished downloading yet.",
-                    'progress': torrent.progress
+                    'progress': obj.torrent_progress
                 }, status=status.HTTP_400_BAD_REQUEST)
-
-        obj = self.get_object()
+        else:
+            obj = self.get_object()
 
         if obj.ext == 'mp4' and obj.mp4_status and obj.mp4_status['progress'] != '100.00':
             return Response({
@@ -25,13 +25,40 @@ task_ignore_result = True
 
 # Task routes
 task_routes = {
+    'torrents.tasks.add_torrent': {
+        'queue': 'torrents.add_torrent',
+    },
+    'torrents.tasks.add_torrents': {
+        'queue': 'torrents.add_torrent',
+    },
+    'torrents.tasks.monitor_torrents': {
+        'queue': 'torrents.monitor_torrents',
+    },
     'torrents.tasks.update_and_save_information': {
         'queue': 'torrents.update_and_save_information',
     },
-    'torrents.tasks.update_and_stop_seeding': {
-        'queue': 'torrents.update_and_stop_seeding',
+    'torrents.tasks.stop_seeding_torrents': {
+        'queue': 'torrents.stop_seeding_torrents',
     },
     'files.tasks.convert_to_mp4': {
         'queue': 'files.convert_to_mp4',
     },
 }
+
+# Beat schedule
+beat_schedule = {
+    'monitor-torrents': {
+        'task': 'torrents.tasks.monitor_torrents',
+        'schedule': 1.0,  # torrents.tasks.MIN_COUNTDOWN
+        'options': {
+            'expires': 1,
+        },
+    },
+    'stop-seeding-torrents': {
+        'task': 'torrents.tasks.stop_seeding_torrents',
+        'schedule': 600.0,  # torrents.tasks.SEEDING_COUNTDOWN
+        'options': {
+            'expires': 600,
+        },
+    },
+}
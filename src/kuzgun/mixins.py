@@ -0,0 +1,195 @@
+import time
+from hashlib import sha1
+
+from django.http import HttpResponse
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from .utils import get_user_version, redis
+
+RESPONSE_CACHE = 'user:{}:response:{}:{}'
+RESPONSE_CACHE_STATS = 'responses:cache'
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+    default_detail = 'Not modified.'
+
+
+class CacheHit(Exception):
+    """
+    Raised to answer the request with the cached response.
+    """
+    def __init__(self, response):
+        self.response = response
+
+
+def strip_weak(etag):
+    """
+    Get the opaque tag of the ETag without its weakness indicator.
+
+    :param etag: str
+    :return: str
+    """
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+class ConditionalMixin(object):
+    """
+    ViewSet mixin which tags the responses of `conditional_actions` with a weak
+    ETag of the user's version stamp and answers the requests whose If-None-Match
+    header matches it with 304 (Not Modified). Matching requests are answered
+    right after authentication, so the database isn't queried and nothing is
+    serialized. Version stamps are bumped whenever the user's torrents or
+    files change (see kuzgun.utils.bump_user_versions).
+
+    Views whose responses also change without a bump (e.g. transfer rates) set
+    `version_bucket`, so their ETags change at least every `version_bucket` seconds.
+    """
+    conditional_actions = ('list', 'retrieve')
+    version_bucket = None  # seconds
+
+    def get_version(self, request):
+        """
+        Get version stamp of the user's torrents and files once per request.
+
+        :param request: Request object
+        :return: str
+        """
+        if getattr(self, 'version', None) is None:
+            self.version = get_user_version(request.user.pk)
+
+            if self.version_bucket:
+                self.version = '{}.{}'.format(self.version, int(time.time() // self.version_bucket))
+
+        return self.version
+
+    def get_etag(self, request):
+        """
+        Get ETag of the user's torrents and files. It's weak, since the same
+        version may be serialized differently (e.g. rates, compression).
+
+        :param request: Request object
+        :return: str
+        """
+        return 'W/{}'.format(quote_etag('{}-{}'.format(request.user.pk, self.get_version(request))))
+
+    def initial(self, request, *args, **kwargs):
+        super(ConditionalMixin, self).initial(request, *args, **kwargs)
+        self.etag = None
+
+        if request.method == 'GET' and self.action in self.conditional_actions:
+            self.etag = self.get_etag(request)
+            etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+
+            # If-None-Match uses the weak comparison.
+            if strip_weak(self.etag) in {strip_weak(etag) for etag in etags} or '*' in etags:
+                raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=exc.status_code)
+
+        return super(ConditionalMixin, self).handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(ConditionalMixin, self).finalize_response(request, response, *args, **kwargs)
+
+        if getattr(self, 'etag', None) and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = self.etag
+
+        return response
+
+
+class CachedResponseMixin(ConditionalMixin):
+    """
+    ViewSet mixin which caches rendered JSON responses of `conditional_actions`
+    in redis by the user, path and query string for `cache_timeout` seconds.
+    Cache keys contain the user's version stamp, so the entries are invalidated
+    by the same signals and tasks which bump it and the stale ones just expire.
+    Cache hits skip the ORM and serializers entirely.
+
+    Hits, misses and their total durations (ms) are counted in RESPONSE_CACHE_STATS
+    (see get_response_cache_stats) and each response is marked with X-Cache header.
+    """
+    cache_timeout = 300  # seconds
+
+    def get_cache_key(self, request):
+        """
+        Get cache key of the request's response.
+
+        :param request: Request object
+        :return: str
+        """
+        path = '{} {}'.format(request.accepted_media_type, request.get_full_path())
+
+        return RESPONSE_CACHE.format(request.user.pk, self.get_version(request), sha1(path.encode()).hexdigest())
+
+    def initial(self, request, *args, **kwargs):
+        self.started, self.cache_key = time.time(), None
+        super(CachedResponseMixin, self).initial(request, *args, **kwargs)
+
+        if self.etag and request.accepted_renderer.format == 'json':
+            self.cache_key = self.get_cache_key(request)
+            cached = redis.hgetall(self.cache_key)
+
+            if cached:
+                raise CacheHit(HttpResponse(cached['content'], content_type=cached['content_type']))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, CacheHit):
+            exc.response['X-Cache'] = 'HIT'
+            self.count_cache_lookup('hit')
+            return exc.response
+
+        return super(CachedResponseMixin, self).handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(CachedResponseMixin, self).finalize_response(request, response, *args, **kwargs)
+
+        if getattr(self, 'cache_key', None) and isinstance(response, Response) and response.status_code == 200:
+            response.render()
+            response['X-Cache'] = 'MISS'
+            self.count_cache_lookup('miss')
+
+            pipe = redis.pipeline(transaction=False)
+            pipe.hmset(self.cache_key, {
+                'content': response.content.decode('utf-8'),
+                'content_type': response['Content-Type'],
+            })
+            pipe.expire(self.cache_key, self.cache_timeout)
+            pipe.execute()
+
+        return response
+
+    def count_cache_lookup(self, result):
+        """
+        Counts the cache lookup and its duration in RESPONSE_CACHE_STATS.
+
+        :param result: `hit` or `miss`
+        :return: None
+        """
+        pipe = redis.pipeline(transaction=False)
+        pipe.hincrby(RESPONSE_CACHE_STATS, '{}s'.format(result), 1)
+        pipe.hincrbyfloat(RESPONSE_CACHE_STATS, '{}_ms'.format(result), (time.time() - self.started) * 1000)
+        pipe.execute()
+
+
+def get_response_cache_stats():
+    """
+    Get hit ratio and average durations (ms) of the cached responses.
+
+    :return: dict
+    """
+    stats = redis.hgetall(RESPONSE_CACHE_STATS)
+    hits, misses = int(stats.get('hits', 0)), int(stats.get('misses', 0))
+
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+        'hit_ms': hits and float(stats['hit_ms']) / hits or 0.0,
+        'miss_ms': misses and float(stats['miss_ms']) / misses or 0.0,
+    }
@@ -0,0 +1,38 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on `id` (newest first), so each page costs the same
+    however deep it is. Total count is only calculated if the `count`
+    query parameter is given (e.g. ?count=true), since it needs a COUNT(*).
+    """
+    ordering = '-id'
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        return super(IdCursorPagination, self).paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        fields = [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]
+
+        if self.count is not None:
+            fields.insert(0, ('count', self.count))
+
+        return Response(OrderedDict(fields))
@@ -0,0 +1,9 @@
+"""
+Redis client shared by the apps. It doesn't import Django REST framework, so
+modules which DRF loads from its settings (e.g. authentication classes) can use it.
+"""
+from redis import ConnectionPool, Redis
+
+# Use ConnectionPool in order to set decode_response to True.
+redis_pool = ConnectionPool(host='redis', port=6379, db=0, decode_responses=True)
+redis = Redis(connection_pool=redis_pool)
@@ -0,0 +1,36 @@
+def get_query_list(request, name):
+    """
+    Get comma separated values of the query parameter as a set.
+
+    :param request: Request object or None
+    :param name: Query parameter name
+    :return: set
+    """
+    if request is None:
+        return set()
+
+    return {value.strip() for value in request.query_params.get(name, '').split(',') if value.strip()}
+
+
+class DynamicFieldsMixin(object):
+    """
+    Serializer mixin which serializes only the fields given in `fields` query
+    parameter of the request (e.g. ?fields=id,name,progress). Fields listed in
+    Meta.expandable_fields are serialized only if they are given in `expand`
+    query parameter (e.g. ?expand=files). Dropped fields are never computed.
+    Applies to the serializers which are given the request in their context,
+    so nested serializers keep all of their fields.
+    """
+    def __init__(self, *args, **kwargs):
+        super(DynamicFieldsMixin, self).__init__(*args, **kwargs)
+        request = self.context.get('request')
+        expand = get_query_list(request, 'expand')
+        fields = get_query_list(request, 'fields')
+
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            if name not in expand:
+                self.fields.pop(name, None)
+
+        if fields:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
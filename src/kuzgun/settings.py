@@ -122,7 +122,7 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
         'users.authentication.QueryStringTokenAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
@@ -160,6 +160,13 @@ STATICFILES_DIRS = [
 MEDIA_ROOT = '/uploads/'
 
 
+# Transmission
+
+# Token of the torrent done script (config/transmission/torrent-done.sh).
+# Torrents are finished only by polling if it's not set.
+TORRENT_DONE_TOKEN = os.environ.get('TORRENT_DONE_TOKEN')
+
+
 # Admin site settings
 admin.site.site_title = 'Kuzgun.io'
 admin.site.site_header = 'Kuzgun.io administration'
@@ -0,0 +1,104 @@
+import json
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from ..utils import redis, EVENTS_CHANNEL
+from ..views import EVENT_STREAM_BUSY_RETRY, EVENT_STREAM_STALE, EVENT_STREAM_USER, EVENT_STREAMS_PER_USER
+
+
+class EventStreamViewTests(APITestCase):
+    """
+    Unit tests for Event Stream endpoint.
+    """
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('johndoe', 'john@doe.com', 'johndoe')
+
+    def _close(self, response):
+        """
+        Closes the response like the test client does, without closing the database connection.
+        """
+        request_finished.disconnect(close_old_connections)
+
+        try:
+            response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+
+    @patch('kuzgun.views.redis')
+    def test_event_stream(self, mock_redis):
+        mock_redis.pipeline.return_value.execute.return_value = [0, 1, 1, True]
+        mock_pubsub = mock_redis.pubsub.return_value
+        mock_pubsub.get_message.side_effect = [
+            None,
+            {'data': json.dumps({'event': 'torrent', 'data': {'id': 1, 'progress': '45.97'}})},
+        ]
+
+        url = reverse('events')
+        response = self.client.get(
+            '{}?token={}'.format(url, self.user.auth_token.key), HTTP_ACCEPT='text/event-stream'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        content = response.streaming_content
+        self.assertEqual(next(content), b'retry: 3000\n\n')
+        self.assertEqual(next(content), b': keep-alive\n\n')
+        self.assertEqual(next(content), b'event: torrent\ndata: {"id": 1, "progress": "45.97"}\n\n')
+
+        mock_pubsub.subscribe.assert_called_with(EVENTS_CHANNEL.format(self.user.pk))
+
+    def test_event_stream_without_credentials_that_return_forbidden(self):
+        url = reverse('events')
+        response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @patch('kuzgun.views.EventStreamView.stream')
+    def test_event_stream_that_limit_streams_of_user(self, mock_stream):
+        mock_stream.return_value = iter([])
+        user_streams = EVENT_STREAM_USER.format(self.user.pk)
+        self.addCleanup(redis.delete, user_streams)
+        url = '{}?token={}'.format(reverse('events'), self.user.auth_token.key)
+
+        responses = [self.client.get(url, HTTP_ACCEPT='text/event-stream') for _ in range(EVENT_STREAMS_PER_USER)]
+        self.assertTrue(all(response.streaming for response in responses))
+        self.assertEqual(redis.zcard(user_streams), EVENT_STREAMS_PER_USER)
+
+        # Rejected stream asks EventSource to reconnect later instead of failing for good.
+        response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.streaming)
+        self.assertTrue(response.content.startswith(
+            'retry: {}\nevent: busy\n'.format(EVENT_STREAM_BUSY_RETRY).encode()
+        ))
+
+        # Slots are released once the streams are closed, even if they are never read.
+        for response in responses:
+            self._close(response)
+
+        self.assertEqual(redis.zcard(user_streams), 0)
+
+    @patch('kuzgun.views.EventStreamView.stream')
+    def test_event_stream_that_prune_stale_streams_of_user(self, mock_stream):
+        mock_stream.return_value = iter([])
+        user_streams = EVENT_STREAM_USER.format(self.user.pk)
+        self.addCleanup(redis.delete, user_streams)
+        url = '{}?token={}'.format(reverse('events'), self.user.auth_token.key)
+
+        # Streams of a killed worker never release their slots nor send heartbeats.
+        redis.zadd(user_streams, **{
+            'leaked{}'.format(i): time.time() - EVENT_STREAM_STALE - 1 for i in range(EVENT_STREAMS_PER_USER)
+        })
+
+        response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+        self.assertTrue(response.streaming)
+        self.assertEqual(redis.zcard(user_streams), 1)
+        self._close(response)
@@ -10,7 +10,7 @@ from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework.documentation import include_docs_urls
 from rest_framework.permissions import AllowAny
 
-from .views import HomeView
+from .views import EventStreamView, HomeView
 
 urlpatterns = [
     url(r'^$', HomeView.as_view(), name='home'),
@@ -21,6 +21,7 @@ urlpatterns = [
     )),
     url(r'^api/auth/', include('rest_framework.urls', namespace='rest_framework')),
     url(r'^api/auth/token', obtain_auth_token),
+    url(r'^api/events/$', EventStreamView.as_view(), name='events'),
     url(r'^api/users/', include('users.urls', namespace='users')),
     url(r'^api/torrents/', include('torrents.urls', namespace='torrents')),
     url(r'^api/files/', include('files.urls', namespace='files')),
@@ -1,8 +1,19 @@
-from redis import ConnectionPool, Redis
+import json
+import time
 
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.db.models.functions import Cast
 from django.utils.timezone import datetime
 from rest_framework.views import exception_handler
 
+from .redis import redis
+
+
+EVENTS_CHANNEL = 'user:{}:events'
+USER_VERSION = 'user:{}:version'
+
 
 def custom_exception_handler(exc, context):
     """
@@ -42,6 +53,114 @@ def unix_time_millis(dt):
     return (naive - epoch).total_seconds()
 
 
-# Use ConnectionPool in order to set decode_response to True.
-redis_pool = ConnectionPool(host='redis', port=6379, db=0, decode_responses=True)
-redis = Redis(connection_pool=redis_pool)
+def bulk_update(objs, fields):
+    """
+    Update given fields of the model objects with a single UPDATE query
+    by using CASE WHEN statements. (Django 1.11 doesn't have bulk_update.)
+
+    :param objs: list of model objects of the same model
+    :param fields: iterable of field names
+    :return: int: number of updated rows
+    """
+    if not objs or not fields:
+        return 0
+
+    model = type(objs[0])
+    updates = {}
+
+    for name in fields:
+        field = model._meta.get_field(name)
+        # Values are cast, since some of them are sent as strings (e.g. decimals) and CASE would be text.
+        updates[field.attname] = Case(*[
+            When(pk=obj.pk, then=Cast(Value(getattr(obj, field.attname), output_field=field), field))
+            for obj in objs
+        ], output_field=field)
+
+    return model.objects.filter(pk__in=[obj.pk for obj in objs]).update(**updates)
+
+
+def get_user_version(user_id):
+    """
+    Get the version stamp of the torrents and files of the user.
+
+    :param user_id: PK of the user
+    :return: str
+    """
+    version = redis.get(USER_VERSION.format(user_id))
+
+    if version is None:
+        bump_user_versions([user_id])
+        version = redis.get(USER_VERSION.format(user_id))
+
+    return version
+
+
+def bump_user_versions(user_ids, pipe=None):
+    """
+    Bumps the version stamps of the users, so their cached listings get stale.
+    Missing stamps start from the current time in milliseconds rather than zero,
+    so a stamp which is lost (e.g. redis is flushed) never repeats an old one.
+
+    :param user_ids: iterable of user PKs
+    :param pipe: Pipeline to queue the commands into, executed here if not given.
+    :return: None
+    """
+    execute = pipe is None
+
+    if execute:
+        pipe = redis.pipeline(transaction=False)
+
+    now = int(time.time() * 1000)
+
+    for user_id in set(user_ids):
+        pipe.set(USER_VERSION.format(user_id), now, nx=True)
+        pipe.incr(USER_VERSION.format(user_id))
+
+    if execute:
+        pipe.execute()
+
+
+def bump_user_versions_on_commit(user_ids):
+    """
+    Bumps the version stamps of the users once the current transaction is committed,
+    right away in autocommit mode. A stamp bumped inside the transaction lets a
+    concurrent request cache the old response under the new stamp.
+
+    :param user_ids: iterable of user PKs, evaluated right away
+    :return: None
+    """
+    user_ids = list(user_ids)
+
+    if user_ids:
+        transaction.on_commit(lambda: bump_user_versions(user_ids))
+
+
+def publish_events(events, bump=True):
+    """
+    Publishes events to the EVENTS_CHANNEL of their users and bumps
+    the version stamps of the users with a single pipeline.
+
+    :param events: iterable of (user_ids, event, data) tuples
+    :param bump: False for the events of live metrics which aren't stored in the database.
+    :return: None
+    """
+    messages, all_user_ids = [], set()
+
+    for user_ids, event, data in events:
+        message = json.dumps({'event': event, 'data': data}, cls=DjangoJSONEncoder)
+        messages.extend((user_id, message) for user_id in user_ids)
+        all_user_ids.update(user_ids)
+
+    # Nothing to publish, e.g. the torrents don't have any user.
+    if not messages:
+        return
+
+    pipe = redis.pipeline(transaction=False)
+
+    for user_id, message in messages:
+        pipe.publish(EVENTS_CHANNEL.format(user_id), message)
+
+    if bump:
+        bump_user_versions(all_user_ids, pipe)
+
+    pipe.execute()
@@ -1,5 +1,167 @@
+import json
+import threading
+import time
+from uuid import uuid4
+
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views.generic.base import TemplateView
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.views import APIView
+
+from .utils import redis, EVENTS_CHANNEL
+
+EVENT_STREAM_TIMEOUT = 300  # seconds, EventSource reconnects after.
+EVENT_STREAM_KEEP_ALIVE = 15  # seconds
+EVENT_STREAM_RETRY = 3000  # milliseconds
+EVENT_STREAM_BUSY_RETRY = 30000  # milliseconds, reconnection delay of the rejected streams.
+EVENT_STREAM_STALE = EVENT_STREAM_KEEP_ALIVE * 3  # seconds without heartbeat, e.g. worker is killed.
+EVENT_STREAM_USER = 'user:{}:event_streams'  # sorted set of connection ids by heartbeat time.
+
+# Each open stream holds a thread of the worker, so streams can't take more than
+# half of the threads (gunicorn runs gthread workers with 16 threads) and
+# a user can't open more than EVENT_STREAMS_PER_USER of them at once.
+EVENT_STREAMS_PER_WORKER = 8
+EVENT_STREAMS_PER_USER = 3
+
+worker_streams = threading.BoundedSemaphore(EVENT_STREAMS_PER_WORKER)
 
 
 class HomeView(TemplateView):
     template_name = 'kuzgun/home.html'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Renderer for text/event-stream so EventSource requests pass content negotiation.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return 'data: {}\n\n'.format(json.dumps(data))
+
+
+class ClosingIterator(object):
+    """
+    Iterates the iterable and calls on_close once when the response is closed,
+    even if the iteration has never started (e.g. client disconnected right away).
+    """
+    def __init__(self, iterable, on_close):
+        self.iterable = iterable
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def close(self):
+        try:
+            if hasattr(self.iterable, 'close'):
+                self.iterable.close()
+        finally:
+            on_close, self.on_close = self.on_close, None
+
+            if on_close is not None:
+                on_close()
+
+
+class EventStreamView(APIView):
+    """
+    Server-Sent Events endpoint (/api/events) of the user.
+    Streams `torrent` and `file` events which are published by the tasks
+    through redis pub/sub. Closes the stream after EVENT_STREAM_TIMEOUT seconds.
+    """
+    renderer_classes = (JSONRenderer, EventStreamRenderer)
+
+    def get(self, request):
+        """
+        Streams events of the user. If the user or the worker already has as many
+        open streams as it's allowed, the stream is closed right away with a `busy`
+        event, so EventSource reconnects after EVENT_STREAM_BUSY_RETRY milliseconds.
+        (It doesn't reconnect ever again after an error status like 429.)
+
+        :return: StreamingHttpResponse
+        """
+        user_streams, connection = EVENT_STREAM_USER.format(request.user.pk), uuid4().hex
+
+        if not worker_streams.acquire(blocking=False):
+            return self.too_many_streams("Too many open event streams, try again later.")
+
+        now = time.time()
+        pipe = redis.pipeline()
+        # Slots of the streams which stopped sending heartbeats are leaked, they are pruned.
+        pipe.zremrangebyscore(user_streams, '-inf', now - EVENT_STREAM_STALE)
+        pipe.zadd(user_streams, **{connection: now})
+        pipe.zcard(user_streams)
+        pipe.expire(user_streams, EVENT_STREAM_TIMEOUT * 2)
+
+        if pipe.execute()[2] > EVENT_STREAMS_PER_USER:
+            self.release(user_streams, connection)
+            return self.too_many_streams("Too many open event streams of the user.")
+
+        response = StreamingHttpResponse(
+            ClosingIterator(
+                self.stream(request.user.pk, user_streams, connection),
+                lambda: self.release(user_streams, connection)
+            ),
+            content_type=EventStreamRenderer.media_type
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+
+        return response
+
+    def too_many_streams(self, detail):
+        response = HttpResponse(
+            'retry: {}\nevent: busy\ndata: {}\n\n'.format(EVENT_STREAM_BUSY_RETRY, json.dumps({'detail': detail})),
+            content_type=EventStreamRenderer.media_type
+        )
+        response['Cache-Control'] = 'no-cache'
+
+        return response
+
+    def release(self, user_streams, connection):
+        """
+        Releases the stream slots of the worker and the user.
+
+        :param user_streams: EVENT_STREAM_USER key of the user
+        :param connection: Connection id of the stream
+        :return: None
+        """
+        redis.zrem(user_streams, connection)
+        worker_streams.release()
+
+    def stream(self, user_id, user_streams, connection):
+        """
+        Subscribes to EVENTS_CHANNEL of the user and yields its messages as events.
+        Sends a comment every EVENT_STREAM_KEEP_ALIVE seconds to keep the connection open
+        and renews the heartbeat of the stream's slot along with it. A disconnected
+        client fails the write, which closes the stream and releases the slot.
+
+        :param user_id: PK of the user
+        :param user_streams: EVENT_STREAM_USER key of the user
+        :param connection: Connection id of the stream
+        :return: generator
+        """
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(EVENTS_CHANNEL.format(user_id))
+        deadline = time.time() + EVENT_STREAM_TIMEOUT
+
+        try:
+            yield 'retry: {}\n\n'.format(EVENT_STREAM_RETRY)
+            heartbeat = time.time()
+
+            while time.time() < deadline:
+                message = pubsub.get_message(timeout=EVENT_STREAM_KEEP_ALIVE)
+
+                if time.time() - heartbeat >= EVENT_STREAM_KEEP_ALIVE:
+                    heartbeat = time.time()
+                    redis.zadd(user_streams, **{connection: heartbeat})
+
+                if message is None:
+                    yield ': keep-alive\n\n'
+                    continue
+
+                event = json.loads(message['data'])
+                yield 'event: {}\ndata: {}\n\n'.format(event['event'], json.dumps(event['data']))
+        finally:
+            pubsub.close()
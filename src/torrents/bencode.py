@@ -0,0 +1,213 @@
+import hashlib
+import re
+from collections import namedtuple
+
+Metainfo = namedtuple('Metainfo', ['info_hash', 'name', 'size', 'files', 'private'])
+
+
+INTEGER = re.compile(br'-?[0-9]+\Z')
+MAX_DEPTH = 64  # nested lists and dictionaries, metainfo needs 4
+
+
+class BencodeError(ValueError):
+    """
+    Raised when the data is not valid bencode or metainfo.
+    """
+
+
+def _decode_string(data, i):
+    colon = data.index(b':', i)
+
+    if not data[i:colon].isdigit():
+        raise BencodeError('Length of the string at {} is not a number.'.format(i))
+
+    end = colon + 1 + int(data[i:colon])
+
+    if end > len(data):
+        raise BencodeError('String at {} exceeds the data.'.format(i))
+
+    return data[colon + 1:end], end
+
+
+def _decode(data, i):
+    """
+    Decodes the value which starts at offset i of data. Lists and dictionaries
+    are decoded with an explicit stack instead of recursion, so deeply nested
+    data fails with BencodeError after MAX_DEPTH levels.
+
+    :param data: bytes
+    :param i: int
+    :return: tuple: decoded value and offset right after it.
+    """
+    stack = []  # [container, pending dictionary key]
+
+    while True:
+        c = data[i]
+
+        if c == 0x65 and stack:  # end of the list or dictionary
+            if stack[-1][1] is not None:
+                raise BencodeError('Key at {} has no value.'.format(i))
+
+            value, i = stack.pop()[0], i + 1
+        elif stack and isinstance(stack[-1][0], dict) and stack[-1][1] is None and not 0x30 <= c <= 0x39:
+            raise BencodeError('Dictionary key at {} is not a string.'.format(i))
+        elif c == 0x6c or c == 0x64:  # l<values>e, d<key><value>e
+            if len(stack) == MAX_DEPTH:
+                raise BencodeError('Nesting at {} is deeper than {}.'.format(i, MAX_DEPTH))
+
+            stack.append([[] if c == 0x6c else {}, None])
+            i += 1
+            continue
+        elif c == 0x69:  # i<integer>e
+            end = data.index(b'e', i)
+
+            if not INTEGER.match(data[i + 1:end]):
+                raise BencodeError('Integer at {} is not a number.'.format(i))
+
+            value, i = int(data[i + 1:end]), end + 1
+        elif 0x30 <= c <= 0x39:  # <length>:<string>
+            value, i = _decode_string(data, i)
+        else:
+            raise BencodeError('Unexpected {!r} at {}.'.format(chr(c), i))
+
+        if not stack:
+            return value, i
+
+        container, key = stack[-1]
+
+        if isinstance(container, list):
+            container.append(value)
+        elif key is None:
+            stack[-1][1] = value
+        else:
+            container[key], stack[-1][1] = value, None
+
+
+def decode(data):
+    """
+    Decodes bencoded data. Strings are returned as bytes.
+
+    :param data: bytes
+    :return: int, bytes, list or dict
+    """
+    data = bytes(data)
+
+    try:
+        value, end = _decode(data, 0)
+    except BencodeError:
+        raise
+    except (IndexError, ValueError, TypeError) as e:
+        raise BencodeError('Invalid bencode: {}'.format(e))
+
+    if end != len(data):
+        raise BencodeError('Trailing data at {}.'.format(end))
+
+    return value
+
+
+def encode(value):
+    """
+    Encodes the value with bencode. Dictionary keys are sorted as the spec requires.
+
+    :param value: int, str, bytes, list or dict
+    :return: bytes
+    """
+    chunks = []
+    _encode(value, chunks)
+
+    return b''.join(chunks)
+
+
+def _encode(value, chunks):
+    if isinstance(value, bool) or not isinstance(value, (int, str, bytes, list, tuple, dict)):
+        raise BencodeError('{!r} can not be encoded.'.format(value))
+
+    if isinstance(value, int):
+        chunks.append(b'i%de' % value)
+    elif isinstance(value, (str, bytes)):
+        value = value.encode() if isinstance(value, str) else value
+        chunks.append(b'%d:' % len(value))
+        chunks.append(value)
+    elif isinstance(value, (list, tuple)):
+        chunks.append(b'l')
+        for item in value:
+            _encode(item, chunks)
+        chunks.append(b'e')
+    else:
+        chunks.append(b'd')
+        for key, item in sorted((k.encode() if isinstance(k, str) else k, v) for k, v in value.items()):
+            _encode(key, chunks)
+            _encode(item, chunks)
+        chunks.append(b'e')
+
+
+def _text(value):
+    return value.decode('utf-8', 'replace')
+
+
+def _utf8(fields, key):
+    """
+    Get the `<key>.utf-8` field if it exists, the key itself otherwise.
+    """
+    utf8_key = key + b'.utf-8'
+    return fields[utf8_key] if utf8_key in fields else fields[key]
+
+
+def parse_metainfo(data):
+    """
+    Parses .torrent (metainfo) data. Info hash is the SHA-1 of the raw info
+    dictionary as it is in the data, so it matches transmission's `hashString`.
+    File paths are joined with the torrent name like transmission's file names.
+
+    :param data: bytes
+    :return: Metainfo
+    """
+    data = bytes(data)
+    metainfo, info_span = {}, None
+
+    try:
+        if data[:1] != b'd':
+            raise BencodeError('Metainfo is not a dictionary.')
+
+        i = 1
+
+        while data[i] != 0x65:
+            key, start = _decode_string(data, i)
+            metainfo[key], i = _decode(data, start)
+
+            if key == b'info':
+                info_span = start, i
+    except BencodeError:
+        raise
+    except (IndexError, ValueError, TypeError) as e:
+        raise BencodeError('Invalid metainfo: {}'.format(e))
+
+    info = metainfo.get(b'info')
+
+    if not isinstance(info, dict):
+        raise BencodeError('Metainfo has no info dictionary.')
+
+    try:
+        name = _text(_utf8(info, b'name'))
+
+        if b'files' in info:
+            files = [
+                ('/'.join([name] + [_text(piece) for piece in _utf8(f, b'path')]), f[b'length'])
+                for f in info[b'files']
+            ]
+        else:
+            files = [(name, info[b'length'])]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise BencodeError('Invalid info dictionary: {}'.format(e))
+
+    for path, length in files:
+        if not isinstance(length, int) or length < 0:
+            raise BencodeError('Length of {} is not a non-negative integer.'.format(path))
+
+    return Metainfo(
+        info_hash=hashlib.sha1(data[info_span[0]:info_span[1]]).hexdigest(),
+        name=name,
+        size=sum(length for _, length in files),
+        files=files,
+        private=info.get(b'private') == 1,
+    )
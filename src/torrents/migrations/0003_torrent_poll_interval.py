@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('torrents', '0002_auto_20170907_0027'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='torrent',
+            name='poll_interval',
+            field=models.PositiveSmallIntegerField(default=5),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('torrents', '0003_torrent_poll_interval'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='torrent',
+            name='hash',
+            field=models.CharField(blank=True, db_index=True, max_length=40, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 12:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def set_added(apps, schema_editor):
+    """
+    Torrents which have a hash were added to transmission before pending torrents kept their hashes.
+    """
+    apps.get_model('torrents', 'Torrent').objects.filter(hash__isnull=False).update(added=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('torrents', '0004_torrent_hash_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='torrent',
+            name='added',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(set_added, migrations.RunPython.noop),
+    ]
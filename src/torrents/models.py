@@ -7,6 +7,7 @@ from enumfields.fields import EnumField
 from .enums import Status
 
 TORRENT_HASH = 'torrent:{}'
+TORRENT_SKIPPED_WRITES = 'torrents:skipped_writes'
 
 
 class Torrent(TimeStampedModel):
@@ -15,7 +16,10 @@ class Torrent(TimeStampedModel):
     Can be linked to User through ManyToMany.
     """
     name = models.CharField(max_length=150)
-    hash = models.CharField(max_length=40, unique=True, db_index=True)
+    # Known info hash of the submitted link, or the one transmission reports once the torrent is added.
+    hash = models.CharField(max_length=40, unique=True, db_index=True, null=True, blank=True)
+    # Set once the torrent is added to transmission. Pending torrents aren't polled.
+    added = models.BooleanField(default=False)
     status = EnumField(Status, max_length=20, default=Status.IN_QUEUE)
     progress = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     ratio = models.DecimalField(max_digits=3, decimal_places=2, default=0)
@@ -23,6 +27,11 @@ class Torrent(TimeStampedModel):
     files = models.ManyToManyField('files.File')
     finished = models.BooleanField(default=False)
     private = models.BooleanField(default=False)
+    poll_interval = models.PositiveSmallIntegerField(default=5)
+
+    # Fields updated by the torrent tasks. Their loaded values are kept
+    # to detect changes, so unchanged Torrent objects aren't written again.
+    TRACKED_FIELDS = ('status', 'progress', 'ratio', 'poll_interval')
 
     class Meta:
         ordering = ('-id',)
@@ -30,8 +39,61 @@ class Torrent(TimeStampedModel):
     def __str__(self):
         return '{} <{}>'.format(self.name, self.hash)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Torrent, cls).from_db(db, field_names, values)
+        instance.set_loaded_values()
+
+        return instance
+
     def save(self, **kwargs):
+        self.format_decimals()
+        result = super(Torrent, self).save(**kwargs)
+        self.set_loaded_values()
+
+        return result
+
+    def save_changes(self):
+        """
+        Saves only the tracked fields which changed since the object was loaded or saved.
+        Does not hit the database if nothing changed.
+
+        :return: bool: True if saved.
+        """
+        changed_fields = self.get_changed_fields()
+
+        if not changed_fields:
+            return False
+
+        self.save(update_fields=changed_fields + ['modified'])
+
+        return True
+
+    def set_loaded_values(self):
+        """
+        Keeps current values of the tracked fields.
+        """
+        self._loaded_values = {
+            name: self.__dict__[name] for name in self.TRACKED_FIELDS if name in self.__dict__
+        }
+
+    def get_changed_fields(self):
+        """
+        Returns names of the tracked fields which changed since the object was loaded or saved.
+
+        :return: list
+        """
+        self.format_decimals()
+        loaded_values = getattr(self, '_loaded_values', {})
+
+        return [
+            name for name in self.TRACKED_FIELDS
+            if name not in loaded_values or loaded_values[name] != getattr(self, name)
+        ]
+
+    def format_decimals(self):
+        """
+        Rounds progress and ratio to two decimal places.
+        """
         self.progress = Decimal('{:.2f}'.format(self.progress))
         self.ratio = Decimal('{:.2f}'.format(self.ratio))
-
-        return super(Torrent, self).save(**kwargs)
@@ -1,13 +1,41 @@
+from django.db.models import Manager
 from rest_framework import serializers
 
+from kuzgun.serializers import DynamicFieldsMixin
 from kuzgun.utils import enum_to_dict, redis
 from files.serializers import FileSerializer
-from .models import Torrent
+from files.utils import load_mp4_statuses
+from .models import Torrent, TORRENT_HASH
 
 
-class TorrentSerializer(serializers.ModelSerializer):
+class TorrentListSerializer(serializers.ListSerializer):
+    """
+    List serializer class of the Torrent model.
+    Fetches rates and mp4_status of the files of the whole page from redis before serializing it.
+    """
+    def to_representation(self, data):
+        torrent_models = list(data.all() if isinstance(data, Manager) else data)
+        fields = self.child.fields
+
+        if 'rate_upload' in fields or 'rate_download' in fields:
+            self.child.load_rates(torrent_models)
+
+        # Files are loaded together only if they are prefetched, otherwise each
+        # nested list is queried again by FileListSerializer.
+        if 'files' in fields and 'mp4_status' in fields['files'].child.fields:
+            load_mp4_statuses(
+                f for torrent_model in torrent_models
+                if 'files' in getattr(torrent_model, '_prefetched_objects_cache', {})
+                for f in torrent_model.files.all()
+            )
+
+        return super(TorrentListSerializer, self).to_representation(torrent_models)
+
+
+class TorrentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer class of the Torrent model.
+    Supports `fields` and `expand` query parameters, files are embedded only with ?expand=files.
     """
     status = serializers.SerializerMethodField()
     rate_upload = serializers.SerializerMethodField()
@@ -17,6 +45,37 @@ class TorrentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Torrent
         fields = '__all__'
+        list_serializer_class = TorrentListSerializer
+        expandable_fields = ('files',)
+
+    def load_rates(self, torrent_models):
+        """
+        Fetches rate upload and rate download of the Torrent objects from redis in one round trip.
+
+        :param torrent_models: list of Torrent objects
+        :return: None
+        """
+        pipe = redis.pipeline(transaction=False)
+
+        for torrent_model in torrent_models:
+            pipe.hmget(TORRENT_HASH.format(torrent_model.pk), 'rate_upload', 'rate_download')
+
+        self.rates = dict(zip((torrent_model.pk for torrent_model in torrent_models), pipe.execute()))
+
+    def get_rates(self, obj):
+        """
+        Get rate upload and rate download loaded by load_rates or from redis.
+
+        :param obj: Torrent object
+        :return: tuple
+        """
+        if not hasattr(self, 'rates'):
+            self.rates = {}
+
+        if obj.pk not in self.rates:
+            self.rates[obj.pk] = redis.hmget(TORRENT_HASH.format(obj.pk), 'rate_upload', 'rate_download')
+
+        return self.rates[obj.pk]
 
     def get_status(self, obj):
         """
@@ -34,7 +93,7 @@ class TorrentSerializer(serializers.ModelSerializer):
         :param obj: Torrent object
         :return: int
         """
-        return int(redis.hget('torrent:{}'.format(obj.pk), 'rate_upload') or 0)
+        return int(self.get_rates(obj)[0] or 0)
 
     def get_rate_download(self, obj):
         """
@@ -43,4 +102,4 @@ class TorrentSerializer(serializers.ModelSerializer):
         :param obj: Torrent object
         :return: int
         """
-        return int(redis.hget('torrent:{}'.format(obj.pk), 'rate_download') or 0)
+        return int(self.get_rates(obj)[1] or 0)
@@ -1,34 +1,69 @@
 import logging
 
-from django.db.models.signals import post_save, m2m_changed
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete
 from django.dispatch import receiver
 
-from files.models import File
+from files.utils import BATCH_SIZE
+from kuzgun.utils import bump_user_versions_on_commit
 from .models import Torrent
-from torrents.tasks import update_and_save_information
 
 logger = logging.getLogger(__name__)
 
 
-@receiver(post_save, sender=Torrent)
-def apply_async_update_and_save_information(**kwargs):
-    """
-    Calls update_and_save_information task right torrent created.
-    """
-    if kwargs['created']:
-        update_and_save_information.delay(kwargs['instance'].pk)
-
-
 @receiver(m2m_changed, sender=Torrent.files.through)
 def link_to_users(**kwargs):
     """
     Links files of the torrent to the users which are related to the torrent.
     Sorry for my bed england if it's not clear; literally it will run right after
     the `torrent.files.add(*files)` operation.
+
+    Links which don't exist yet are inserted into the through table at once.
+    """
+    if kwargs['action'] != 'post_add' or not kwargs['pk_set']:
+        return
+
+    through = get_user_model().files.through
+    user_ids = list(kwargs['instance'].user_set.values_list('pk', flat=True))
+    existing = set(through.objects.filter(
+        myuser_id__in=user_ids, file_id__in=kwargs['pk_set']
+    ).values_list('myuser_id', 'file_id'))
+    links = [
+        through(myuser_id=user_id, file_id=file_id)
+        for user_id in user_ids for file_id in kwargs['pk_set'] if (user_id, file_id) not in existing
+    ]
+
+    try:
+        with transaction.atomic():
+            through.objects.bulk_create(links, batch_size=BATCH_SIZE)
+    except IntegrityError:
+        # Some of the files are linked concurrently (e.g. another torrent with the same files finished).
+        for user in get_user_model().objects.filter(pk__in=user_ids):
+            user.files.add(*kwargs['pk_set'])
+
+    bump_user_versions_on_commit(user_ids)
+
+    logger.info('{} files of {} linked to {} users ({} links already exist).'.format(
+        len(kwargs['pk_set']), kwargs['instance'], len(user_ids), len(existing)
+    ))
+
+
+@receiver(post_save, sender=Torrent)
+def bump_versions_on_save(**kwargs):
     """
-    if kwargs['action'] == 'post_add':
-        files = File.objects.filter(pk__in=kwargs['pk_set'])
+    Bumps version stamps of the users of the saved torrent (e.g. edited in the admin)
+    once the transaction is committed. Torrents don't have any user right after they
+    are created, and the tasks publish the fields they save with `save_changes()`.
+    """
+    if not kwargs['created'] and not kwargs['update_fields']:
+        bump_user_versions_on_commit(kwargs['instance'].user_set.values_list('pk', flat=True))
+
 
-        for user in kwargs['instance'].user_set.all().iterator():
-            user.files.add(*files)
-            logger.info('{} linked to {}'.format(list(files), user))
+@receiver(pre_delete, sender=Torrent)
+def bump_versions_on_delete(**kwargs):
+    """
+    Bumps version stamps of the users of the torrent which is about to be deleted,
+    since its links are deleted along with it without any m2m_changed signal.
+    """
+    bump_user_versions_on_commit(kwargs['instance'].user_set.values_list('pk', flat=True))
@@ -1,72 +1,539 @@
+import base64
+import time
+
+from celery.signals import worker_ready
 from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import IntegrityError
 from django.db.models import Sum
 from django.utils import timezone
+from redis.exceptions import LockError
 
 from kuzgun.celery import app
-from kuzgun.utils import redis
+from kuzgun.utils import bulk_update, bump_user_versions, enum_to_dict, publish_events, redis
 from files.utils import create_from_torrent
 from .enums import Status
-from .models import Torrent, TORRENT_HASH
-from .utils import transmission
+from .models import Torrent, TORRENT_SKIPPED_WRITES
+from .bencode import parse_metainfo
+from .utils import (
+    fetch_metainfo, get_free_space, get_user_ids, transmission, TorrentMetrics, TransmissionError,
+    TransmissionUnavailable, FINISH_FIELDS, POLL_FIELDS, RESET_TIMEOUT, SEED_FIELDS
+)
 
 COUNTDOWN = 5  # seconds
+MIN_COUNTDOWN = 1  # seconds
+MAX_COUNTDOWN = 60  # seconds
+SEEDING_COUNTDOWN = 600  # seconds
+DONE_SCRIPT_COUNTDOWN = 300  # seconds, max poll interval if torrent done script is enabled.
+SEEDING_HOURS = 24
+BATCH_SIZE = 250  # torrents per get_torrents call
+MONITOR_LOCK = 'torrents:monitor'
+MONITOR_LOCK_TIMEOUT = COUNTDOWN * 2  # seconds per batch
+FINISH_LOCK = 'torrent:{}:finish'
+TORRENT_SCHEDULE = 'torrents:schedule'
+
+# Statuses which a torrent waits in without downloading.
+WAITING_STATUSES = (Status.IN_QUEUE, Status.CHECK_PENDING, Status.CHECKING, Status.STOPPED)
+
+# Transmission statuses which don't exist in Status.
+QUEUE_STATUSES = ('download pending', 'seed pending')
+
 logger = get_task_logger(__name__)
 
 
-@app.task(bind=True)
-def update_and_stop_seeding(self, torrent_id):
+def get_status(torrent):
+    """
+    Get Status of the transmission torrent object.
+    Queued torrents are reported as Status.IN_QUEUE.
+
+    :param torrent: Transmission torrent object
+    :return: Status
+    """
+    if torrent.status in QUEUE_STATUSES:
+        return Status.IN_QUEUE
+
+    return Status(torrent.status)
+
+
+def get_poll_interval(torrent_model, torrent):
+    """
+    Get seconds until the next poll of the downloading torrent.
+    Waiting and stalled torrents back off up to MAX_COUNTDOWN, active
+    torrents are polled more often as they get closer to completion.
+    If the torrent done script is enabled, completion is notified by
+    transmission and polling is only a safety net between MAX_COUNTDOWN
+    and DONE_SCRIPT_COUNTDOWN.
+
+    :param torrent_model: Torrent object with updated status
+    :param torrent: Transmission torrent object
+    :return: int
+    """
+    if settings.TORRENT_DONE_TOKEN:
+        min_countdown, max_countdown, max_backoff = MAX_COUNTDOWN, DONE_SCRIPT_COUNTDOWN, DONE_SCRIPT_COUNTDOWN
+    else:
+        min_countdown, max_countdown, max_backoff = MIN_COUNTDOWN, COUNTDOWN * 2, MAX_COUNTDOWN
+
+    if torrent_model.status in WAITING_STATUSES or not torrent.rateDownload:
+        return min(max(torrent_model.poll_interval, COUNTDOWN) * 2, max_backoff)
+
+    try:
+        eta = torrent.eta
+    except ValueError:  # Transmission can't estimate.
+        eta = None
+
+    if eta is None:
+        return max(COUNTDOWN, min_countdown)
+
+    return int(min(max(eta.total_seconds() / 2, min_countdown), max_countdown))
+
+
+def update_information(torrent_model, torrent, metrics):
+    """
+    Copies status, progress and ratio of the transmission torrent object
+    to the Torrent object, sets its poll interval and collects its rates
+    into metrics. Does not save the Torrent object or flush metrics.
+
+    :param torrent_model: Torrent object
+    :param torrent: Transmission torrent object
+    :param metrics: TorrentMetrics object
+    :return: None
     """
-    Checks the Torrent object every COUNTDOWN seconds and
-    stops the torrent from seeding if it's seeded more than 24 hours.
+    torrent_model.status = get_status(torrent)
+    torrent_model.progress = torrent.progress
+    torrent_model.ratio = torrent.ratio
+    torrent_model.poll_interval = get_poll_interval(torrent_model, torrent)
+    torrent_model.format_decimals()
+
+    metrics.set(
+        torrent_model.pk,
+        rate_upload=torrent.rateUpload,
+        rate_download=torrent.rateDownload,
+        progress=torrent_model.progress,
+    )
+
+
+def count_skipped_writes(amount=1):
+    """
+    Increments TORRENT_SKIPPED_WRITES counter in redis by amount.
+
+    :param amount: int
+    :return: None
+    """
+    if amount:
+        redis.incr(TORRENT_SKIPPED_WRITES, amount)
+
+
+def publish_torrent_events(torrent_models, metrics):
+    """
+    Publishes changes of the Torrent objects along with their collected
+    metrics to the users of the torrents as `torrent` events.
+    Must be called before metrics are flushed.
+
+    :param torrent_models: list of Torrent objects
+    :param metrics: TorrentMetrics object
+    :return: None
+    """
+    if not torrent_models:
+        return
+
+    user_ids = get_user_ids(torrent_model.pk for torrent_model in torrent_models)
+    metrics.published.update(torrent_model.pk for torrent_model in torrent_models)
+
+    publish_events(
+        (user_ids[torrent_model.pk], 'torrent', dict(
+            metrics.updates.get(torrent_model.pk, {}),
+            id=torrent_model.pk,
+            status=enum_to_dict(torrent_model.status),
+            progress=torrent_model.progress,
+            ratio=torrent_model.ratio,
+            finished=torrent_model.finished,
+            poll_interval=torrent_model.poll_interval,
+        ))
+        for torrent_model in torrent_models if user_ids[torrent_model.pk]
+    )
+
+
+def delay_update_and_save_information(torrent_id):
+    """
+    Calls update_and_save_information task to finish the downloaded torrent
+    unless it's already called for the torrent.
 
-    :param self: instance of @app.task
     :param torrent_id: PK of Torrent object
-    :return: None|AsyncResult
+    :return: bool: True if called.
     """
+    if not redis.set(FINISH_LOCK.format(torrent_id), 1, nx=True, ex=COUNTDOWN * 60):
+        return False
+
+    update_and_save_information.delay(torrent_id)
+
+    return True
+
+
+@app.task
+def monitor_torrents():
+    """
+    Polls unfinished Torrent objects which are due in TORRENT_SCHEDULE with one
+    get_torrents call per BATCH_SIZE torrents and bulk-updates the changed ones.
+    Completed torrents are handed over to the update_and_save_information task.
+    Torrents which don't exist in transmission are polled every MAX_COUNTDOWN seconds.
+    Scheduled every MIN_COUNTDOWN seconds by celery beat.
+
+    :return: None
+    """
+    if transmission.is_unavailable:
+        logger.warn('Transmission is unavailable, torrents are not polled.')
+        return
+
+    lock = redis.lock(MONITOR_LOCK, timeout=MONITOR_LOCK_TIMEOUT)
+
+    if not lock.acquire(blocking=False):
+        logger.info('Previous monitor_torrents run has not finished yet.')
+        return
 
+    try:
+        now = time.time()
+
+        if not redis.exists(TORRENT_SCHEDULE):
+            schedule_unfinished_torrents()
+
+        due = redis.zrangebyscore(TORRENT_SCHEDULE, '-inf', now)
+        torrent_models = list(Torrent.objects.filter(pk__in=due, finished=False, added=True))
+        missing = set(due) - {str(torrent_model.pk) for torrent_model in torrent_models}
+
+        if missing:
+            # Deleted or finished torrents.
+            redis.zrem(TORRENT_SCHEDULE, *missing)
+
+        metrics = TorrentMetrics(ttl=DONE_SCRIPT_COUNTDOWN * 2)
+        schedule, changed, skipped = {}, [], 0
+
+        for i in range(0, len(torrent_models), BATCH_SIZE):
+            if i:
+                # Each batch may take up to MONITOR_LOCK_TIMEOUT, so the lock lives as long as the batches.
+                lock.extend(MONITOR_LOCK_TIMEOUT)
+
+            batch = torrent_models[i:i + BATCH_SIZE]
+            torrents = {
+                torrent.hashString: torrent
+                for torrent in transmission.get_torrents(
+                    [torrent_model.hash for torrent_model in batch], arguments=POLL_FIELDS
+                )
+            }
+            updated, changed_fields = [], set()
+
+            for torrent_model in batch:
+                torrent = torrents.get(torrent_model.hash)
+
+                if torrent is None:
+                    logger.warn('{} does not exist in transmission.'.format(torrent_model))
+                    schedule[str(torrent_model.pk)] = now + MAX_COUNTDOWN
+                    continue
+
+                update_information(torrent_model, torrent, metrics)
+                schedule[str(torrent_model.pk)] = now + torrent_model.poll_interval
+
+                if int(torrent_model.progress) == 100:
+                    delay_update_and_save_information(torrent_model.pk)
+                    continue
+
+                fields = torrent_model.get_changed_fields()
+
+                if not fields:
+                    skipped += 1
+                    continue
+
+                torrent_model.modified = timezone.now()
+                changed_fields.update(fields)
+                updated.append(torrent_model)
+
+            bulk_update(updated, changed_fields | {'modified'})
+            changed.extend(updated)
+
+        if schedule:
+            redis.zadd(TORRENT_SCHEDULE, **schedule)
+
+        publish_torrent_events(changed, metrics)
+        metrics.flush()
+        count_skipped_writes(skipped)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warn('Lock of monitor_torrents expired before the run finished.')
+
+
+def schedule_unfinished_torrents():
+    """
+    Schedules all unfinished torrents which are added to transmission to be polled right away.
+    Called if TORRENT_SCHEDULE doesn't exist (e.g. redis is flushed), so none of them is left out.
+    Torrents are scheduled by add_torrent and monitor_torrents afterwards.
+
+    :return: None
+    """
+    schedule = {
+        str(pk): 0 for pk in Torrent.objects.filter(finished=False, added=True).values_list('pk', flat=True)
+    }
+
+    if schedule:
+        redis.zadd(TORRENT_SCHEDULE, **schedule)
+
+
+def merge_into(torrent_model, duplicate):
+    """
+    Moves users of the pending Torrent object to its duplicate and deletes it.
+
+    :param torrent_model: Pending Torrent object
+    :param duplicate: Torrent object with the same hash
+    :return: None
+    """
+    duplicate.user_set.add(*torrent_model.user_set.all())
+    torrent_model.delete()
+
+    logger.info('{} merged into {}.'.format(torrent_model, duplicate))
+
+
+def reject(torrent_model, detail):
+    """
+    Deletes the pending Torrent object which can't be added and notifies
+    its users with a `torrent_error` event.
+
+    :param torrent_model: Pending Torrent object
+    :param detail: Reason of the rejection
+    :return: None
+    """
+    user_ids = list(torrent_model.user_set.values_list('pk', flat=True))
+    publish_events([(user_ids, 'torrent_error', {
+        'id': torrent_model.pk,
+        'name': torrent_model.name,
+        'detail': detail,
+    })])
+    torrent_model.delete()
+
+
+def get_reserved_space(exclude_id=None):
+    """
+    Get bytes which unfinished torrents of known size still have to download.
+
+    :param exclude_id: PK of Torrent object to exclude
+    :return: int
+    """
+    torrents = Torrent.objects.filter(finished=False, size__gt=0).exclude(pk=exclude_id)
+
+    return int(sum(size * (100 - progress) / 100 for size, progress in torrents.values_list('size', 'progress')))
+
+
+def read_metainfo(link, metainfo=None):
+    """
+    Get base64 encoded metainfo and its parsed Metainfo. Downloads the
+    .torrent file of the link unless metainfo is given.
+
+    :param link: Torrent link
+    :param metainfo: Base64 encoded .torrent file
+    :return: tuple: str, Metainfo
+    :raises: ValueError (BencodeError) or OSError
+    """
+    if metainfo is None:
+        metainfo = base64.b64encode(fetch_metainfo(link)).decode()
+
+    return metainfo, parse_metainfo(base64.b64decode(metainfo))
+
+
+@app.task
+def add_torrent(torrent_id, link=None, metainfo=None):
+    """
+    Adds the magnet/torrent link or the uploaded .torrent file of the pending
+    Torrent object to transmission, sets its hash and marks it added. The Torrent object is merged
+    into the existing one if the same torrent is already submitted with another link.
+    Pending Torrent objects are not polled by monitor_torrents until they are scheduled here.
+
+    Torrent files are downloaded and parsed here, so duplicates are merged and
+    torrents which don't fit the free disk space are rejected without any RPC.
+    Users are notified of rejected torrents by `torrent_error` events.
+
+    :param torrent_id: PK of pending Torrent object
+    :param link: Magnet or torrent link
+    :param metainfo: Base64 encoded .torrent file
+    :return: None
+    """
     try:
         torrent_model = Torrent.objects.get(pk=torrent_id)
-    except Torrent.DoesNotExist as e:
-        logger.info(
-            "Torrent (#{}) does not exist. It may be force deleted before it's completed.".format(torrent_id),
-            exc_info=e
-        )
-        
+    except Torrent.DoesNotExist:
+        logger.warn('Torrent (#{}) does not exist. It may be deleted before it is added.'.format(torrent_id))
         return
 
-    past = timezone.now() + timezone.timedelta(hours=-24)
-    torrent = transmission.get_torrent(torrent_model.hash)
+    if metainfo is not None or not link.startswith('magnet:'):
+        try:
+            metainfo, info = read_metainfo(link, metainfo)
+        except (OSError, ValueError) as e:
+            logger.error('Torrent file of {} could not be read.'.format(torrent_model), exc_info=e)
+            reject(torrent_model, "Torrent file could not be read.")
+            return
+
+        duplicate = Torrent.objects.filter(hash=info.info_hash).exclude(pk=torrent_model.pk).first()
+
+        if duplicate is not None:
+            merge_into(torrent_model, duplicate)
+            return
 
-    if torrent_model.created < past or Status(torrent.status) == Status.STOPPED:
-        torrent_model.ratio = torrent.ratio
-        torrent_model.status = Status.STOPPED
-        torrent_model.save()
-        torrent.stop()
+        free_space = get_free_space()
 
-        redis.hset('torrent:{}'.format(torrent_model.pk), 'rate_upload', 0)
+        if free_space is not None and info.size > free_space - get_reserved_space(torrent_model.pk):
+            logger.error('{} ({} bytes) does not fit the free disk space.'.format(torrent_model, info.size))
+            reject(torrent_model, "Torrent does not fit the free disk space.")
+            return
 
-        logger.info('{} stopped seeding.'.format(torrent_model))
+        torrent_model.name = info.name[:150]
+        torrent_model.size = info.size
+        torrent_model.private = info.private
 
+    try:
+        torrent = transmission.add_torrent(metainfo or link)
+    except TransmissionUnavailable as e:
+        logger.warn('{} will be added once transmission is available.'.format(torrent_model), exc_info=e)
+        add_torrent.apply_async((torrent_model.pk, link, metainfo), countdown=RESET_TIMEOUT)
+        return
+    except TransmissionError as e:
+        logger.error('{} could not be added to transmission.'.format(torrent_model), exc_info=e)
+        reject(torrent_model, "Torrent could not be added to transmission.")
         return
 
-    redis.hset('torrent:{}'.format(torrent_model.pk), 'rate_upload', torrent.rateUpload)
+    duplicate = Torrent.objects.filter(hash=torrent.hashString).exclude(pk=torrent_model.pk).first()
 
-    torrent_model.ratio = torrent.ratio
-    torrent_model.status = Status(torrent.status)
-    torrent_model.save()
+    if duplicate is not None:
+        merge_into(torrent_model, duplicate)
+        return
+
+    torrent_model.hash, torrent_model.added = torrent.hashString, True
+
+    # Transmission names magnet torrents by their hash until it fetches their metadata.
+    if torrent.name != torrent.hashString:
+        torrent_model.name = torrent.name[:150]
+
+    try:
+        torrent_model.save(update_fields=['hash', 'added', 'name', 'size', 'private', 'modified'])
+    except IntegrityError:
+        # Same torrent is added by another add_torrent task concurrently.
+        merge_into(torrent_model, Torrent.objects.get(hash=torrent.hashString))
+        return
+
+    redis.zadd(TORRENT_SCHEDULE, **{str(torrent_model.pk): time.time()})
+    bump_user_versions(torrent_model.user_set.values_list('pk', flat=True))
+
+    logger.info('{} added to transmission.'.format(torrent_model))
+
+
+@app.task
+def add_torrents(torrents):
+    """
+    Adds the links of the pending Torrent objects to transmission in one pass.
 
-    return self.apply_async((torrent_id,), countdown=COUNTDOWN)
+    :param torrents: list of [PK of pending Torrent object, link] pairs
+    :return: None
+    """
+    for torrent_id, link in torrents:
+        add_torrent(torrent_id, link)
+
+
+@worker_ready.connect
+def reconcile_on_startup(**kwargs):
+    """
+    Runs monitor_torrents and stop_seeding_torrents right after a worker is ready.
+    Nothing has to be rebuilt since both read torrents from the database.
+    """
+    monitor_torrents.delay()
+    stop_seeding_torrents.delay()
 
 
-@app.task(bind=True)
-def update_and_save_information(self, torrent_id):
+@app.task
+def stop_seeding_torrents():
     """
-    Updates the Torrent object every COUNTDOWN seconds and stops
-    when the torrent finishes downloading.
+    Reconciles seeding Torrent objects with one get_torrents call per BATCH_SIZE
+    torrents. Torrents which seeded more than SEEDING_HOURS are stopped here, the
+    ones which reached SEED_RATIO_LIMIT are already stopped by transmission.
+    Scheduled every SEEDING_COUNTDOWN seconds by celery beat.
+
+    :return: None
+    """
+    if transmission.is_unavailable:
+        logger.warn('Transmission is unavailable, seeding torrents are not reconciled.')
+        return
+
+    past = timezone.now() + timezone.timedelta(hours=-SEEDING_HOURS)
+    torrent_models = list(Torrent.objects.filter(finished=True).exclude(status=Status.STOPPED))
+    metrics = TorrentMetrics(ttl=SEEDING_COUNTDOWN * 2)
+    changed, skipped = [], 0
+
+    for i in range(0, len(torrent_models), BATCH_SIZE):
+        batch = torrent_models[i:i + BATCH_SIZE]
+        torrents = {
+            torrent.hashString: torrent
+            for torrent in transmission.get_torrents(
+                [torrent_model.hash for torrent_model in batch], arguments=SEED_FIELDS
+            )
+        }
+        updated, changed_fields, stop_ids = [], set(), []
+
+        for torrent_model in batch:
+            torrent = torrents.get(torrent_model.hash)
+
+            if torrent is None:
+                logger.warn('{} does not exist in transmission.'.format(torrent_model))
+                torrent_model.status = Status.STOPPED
+            else:
+                torrent_model.ratio = torrent.ratio
+                torrent_model.status = get_status(torrent)
+
+                if torrent_model.status != Status.STOPPED and torrent_model.created < past:
+                    torrent_model.status = Status.STOPPED
+                    stop_ids.append(torrent.id)
+
+            rate_upload = torrent_model.status != Status.STOPPED and torrent.rateUpload or 0
+            metrics.set(torrent_model.pk, rate_upload=rate_upload)
+
+            if torrent_model.status == Status.STOPPED:
+                logger.info('{} stopped seeding.'.format(torrent_model))
+
+            fields = torrent_model.get_changed_fields()
+
+            if not fields:
+                skipped += 1
+                continue
+
+            torrent_model.modified = timezone.now()
+            changed_fields.update(fields)
+            updated.append(torrent_model)
+
+        if stop_ids:
+            transmission.stop_torrent(stop_ids)
+
+        bulk_update(updated, changed_fields | {'modified'})
+        changed.extend(updated)
+
+    publish_torrent_events(changed, metrics)
+    metrics.flush()
+    count_skipped_writes(skipped)
+
+
+def release_finish_lock(torrent_model, error):
+    """
+    Lets monitor_torrents call update_and_save_information again once transmission is available.
+
+    :param torrent_model: Torrent object
+    :param error: TransmissionUnavailable
+    :return: None
+    """
+    redis.delete(FINISH_LOCK.format(torrent_model.pk))
+    logger.warn('{} is not updated, transmission is unavailable.'.format(torrent_model), exc_info=error)
+
+
+@app.task
+def update_and_save_information(torrent_id):
+    """
+    Updates the Torrent object once and finishes it if the torrent
+    is downloaded. Periodic updates are done by monitor_torrents.
 
-    :param self: instance of @app.task
     :param torrent_id: PK of Torrent object
-    :return: None|AsyncResult
+    :return: None
     """
 
     try:
@@ -79,36 +546,52 @@ def update_and_save_information(self, torrent_id):
 
         return
 
-    torrent = transmission.get_torrent(torrent_model.hash)
+    if torrent_model.finished or not torrent_model.added:
+        return
 
-    torrent_model.status = Status(torrent.status)
-    torrent_model.progress = torrent.progress
-    torrent_model.ratio = torrent.ratio
+    metrics = TorrentMetrics(ttl=DONE_SCRIPT_COUNTDOWN * 2)
 
-    redis.hmset(TORRENT_HASH.format(torrent_model.pk), {
-        'rate_upload': torrent.rateUpload,
-        'rate_download': torrent.rateDownload
-    })
+    try:
+        torrent = transmission.get_torrent(torrent_model.hash, arguments=POLL_FIELDS)
+    except TransmissionUnavailable as e:
+        release_finish_lock(torrent_model, e)
+        return
+
+    update_information(torrent_model, torrent, metrics)
 
     if int(torrent_model.progress) != 100:
-        torrent_model.save()
-        return self.apply_async((torrent_id,), countdown=COUNTDOWN)
+        if torrent_model.save_changes():
+            publish_torrent_events([torrent_model], metrics)
+        else:
+            count_skipped_writes()
+
+        metrics.flush()
+        return
+
+    # File list is requested only once the torrent is downloaded.
+    try:
+        torrent = transmission.get_torrent(torrent_model.hash, arguments=FINISH_FIELDS)
+    except TransmissionUnavailable as e:
+        release_finish_lock(torrent_model, e)
+        return
 
     files = create_from_torrent(torrent)
     torrent_model.files.add(*files)
 
+    torrent_model.name = torrent.name[:150]
+    torrent_model.private = torrent.isPrivate
     torrent_model.finished = True
     torrent_model.progress = 100
+    torrent_model.poll_interval = SEEDING_COUNTDOWN
     torrent_model.size = torrent_model.files.all().aggregate(Sum('size')).get('size__sum', 0)
     torrent_model.save()
 
-    redis.hmset('torrent:{}'.format(torrent_model.pk), {
-        'rate_upload': 0,
-        'rate_download': 0,
-    })
+    metrics.set(torrent_model.pk, rate_upload=0, rate_download=0, progress=torrent_model.progress)
+    publish_torrent_events([torrent_model], metrics)
+    metrics.flush()
+    redis.delete(FINISH_LOCK.format(torrent_model.pk))
+    redis.zrem(TORRENT_SCHEDULE, torrent_model.pk)
 
     logger.info('{} finished downloading.'.format(torrent_model))
 
-    update_and_stop_seeding.delay(torrent_id)
-
     return
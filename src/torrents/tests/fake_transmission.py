@@ -0,0 +1,267 @@
+"""
+In-process stand-in of transmission daemon's RPC for tests and benchmarks.
+Implements session-id handshake, `session-get`, `torrent-get`, `torrent-add`,
+`torrent-set` and `torrent-stop` methods over HTTP with keep-alive.
+
+    with FakeTransmission() as fake:
+        hashes = fake.create_torrents(1000, file_count=50, curve=linear(60))
+        client = LazyTransmissionRPC(fake.address, port=fake.port)
+"""
+
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from ..bencode import parse_metainfo
+from ..utils import get_info_hash
+
+SESSION_ID = 'fake-session-id'
+RPC_VERSION = 15
+RPC_METHODS = ('session-get', 'torrent-get', 'torrent-add', 'torrent-set', 'torrent-stop')
+
+# Torrent statuses of the RPC (version 14+).
+STOPPED, CHECK_PENDING, CHECKING, DOWNLOAD_PENDING, DOWNLOADING, SEED_PENDING, SEEDING = range(7)
+
+
+def linear(duration):
+    """
+    Progress curve of a torrent which downloads at a constant rate in duration seconds.
+    """
+    return lambda elapsed: min(elapsed / duration, 1.0)
+
+
+def stalled(fraction):
+    """
+    Progress curve of a torrent which doesn't download any further than fraction.
+    """
+    return lambda elapsed: fraction
+
+
+def completed():
+    """
+    Progress curve of a downloaded torrent.
+    """
+    return lambda elapsed: 1.0
+
+
+class FakeTorrent(object):
+    """
+    Torrent of FakeTransmission. Its progress is curve(seconds since added).
+    """
+    def __init__(self, torrent_id, info_hash, name, files, curve, added, private=False):
+        self.id = torrent_id
+        self.hash = info_hash
+        self.name = name
+        self.files = files
+        self.size = sum(length for _, length in files)
+        self.curve = curve
+        self.added = added
+        self.private = private
+        self.stopped = False
+
+    def get_fields(self, fields, now):
+        """
+        Get values of the RPC fields at now.
+
+        :param fields: list of field names
+        :param now: timestamp
+        :return: dict
+        """
+        elapsed = now - self.added
+        fraction = self.curve(elapsed)
+        done = int(self.size * fraction)
+        downloading = not self.stopped and fraction < 1
+        seeding = not self.stopped and fraction >= 1
+        rate_download = downloading and int(self.curve(elapsed + 1) * self.size) - done or 0
+        rate_upload = not self.stopped and rate_download // 4 + (seeding and 1024 * 1024 or 0) or 0
+        values = {
+            'id': self.id,
+            'hashString': self.hash,
+            'name': self.name,
+            'isPrivate': self.private,
+            'status': STOPPED if self.stopped else SEEDING if seeding else DOWNLOADING,
+            'sizeWhenDone': self.size,
+            'leftUntilDone': self.size - done,
+            'uploadRatio': self.size and round(rate_upload * elapsed / 4 / self.size, 2) or 0,
+            'rateDownload': rate_download,
+            'rateUpload': rate_upload,
+            'eta': rate_download and (self.size - done) // rate_download or -1,
+            'files': [
+                {'name': path, 'length': length, 'bytesCompleted': int(length * fraction)}
+                for path, length in self.files
+            ],
+            'priorities': [0] * len(self.files),
+            'wanted': [1] * len(self.files),
+        }
+
+        return {field: values[field] for field in fields if field in values}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles RPC requests of FakeTransmission with keep-alive connections.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, code, body=b'', headers=None):
+        self.send_response(code)
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        query = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        fake.request_count += 1
+
+        if self.headers.get('X-Transmission-Session-Id') != SESSION_ID:
+            self.send_body(409, headers={'X-Transmission-Session-Id': SESSION_ID})
+            return
+
+        if query['method'] not in RPC_METHODS:
+            result, arguments = 'method name not recognized', {}
+        else:
+            with fake.lock:
+                result, arguments = getattr(fake, query['method'].replace('-', '_'))(**query.get('arguments', {}))
+
+        response = {'result': result, 'arguments': arguments, 'tag': query.get('tag')}
+        self.send_body(200, json.dumps(response).encode(), {'Content-Type': 'application/json'})
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeTransmission(object):
+    """
+    Fake transmission daemon which serves RPC on a local port in a thread.
+    Added torrents download with default_curve and have default_file_count
+    files unless they are added with a metainfo.
+    """
+    def __init__(self, default_curve=None, default_file_count=1, clock=time.time):
+        self.default_curve = default_curve or linear(60)
+        self.default_file_count = default_file_count
+        self.clock = clock
+        self.torrents = {}
+        self.torrent_ids = {}
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.server.fake = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def create_torrent(self, info_hash=None, name=None, files=None, file_count=None, curve=None, private=False):
+        """
+        Creates a torrent as if it's added to the daemon.
+
+        :return: FakeTorrent
+        """
+        torrent_id = len(self.torrents) + 1
+        info_hash = info_hash or hashlib.sha1(str(torrent_id).encode()).hexdigest()
+        name = name or 'Torrent.{:05d}'.format(torrent_id)
+
+        if files is None:
+            files = [
+                ('{}/{}.E{:05d}.mkv'.format(name, name, i), 1024 * 1024 * (i % 700 + 1))
+                for i in range(file_count or self.default_file_count)
+            ]
+
+        torrent = FakeTorrent(
+            torrent_id, info_hash, name, files, curve or self.default_curve, self.clock(), private
+        )
+        self.torrents[info_hash] = self.torrent_ids[torrent_id] = torrent
+
+        return torrent
+
+    def create_torrents(self, count, **kwargs):
+        """
+        Creates count torrents.
+
+        :return: list of info hashes
+        """
+        return [self.create_torrent(**kwargs).hash for _ in range(count)]
+
+    def select(self, ids=None):
+        """
+        Get torrents of the ids (ids or hashes) or all torrents.
+
+        :return: list of FakeTorrent
+        """
+        if ids is None:
+            return list(self.torrents.values())
+
+        torrents = (
+            isinstance(torrent_id, int) and self.torrent_ids.get(torrent_id) or self.torrents.get(torrent_id)
+            for torrent_id in (isinstance(ids, list) and ids or [ids])
+        )
+
+        return [torrent for torrent in torrents if torrent is not None]
+
+    def session_get(self, **arguments):
+        return 'success', {'rpc-version': RPC_VERSION, 'rpc-version-minimum': 1, 'version': '2.92 (fake)'}
+
+    def torrent_get(self, fields, ids=None, **arguments):
+        now = self.clock()
+
+        return 'success', {'torrents': [torrent.get_fields(fields, now) for torrent in self.select(ids)]}
+
+    def torrent_add(self, filename=None, metainfo=None, **arguments):
+        kwargs = {}
+
+        if metainfo is not None:
+            info = parse_metainfo(base64.b64decode(metainfo))
+            kwargs = {'info_hash': info.info_hash, 'name': info.name, 'files': info.files, 'private': info.private}
+        elif filename.startswith('magnet:'):
+            kwargs = {'info_hash': get_info_hash(filename)}
+        else:
+            kwargs = {'info_hash': hashlib.sha1(filename.encode()).hexdigest()}
+
+        torrent = self.torrents.get(kwargs['info_hash'])
+        key = torrent and 'torrent-duplicate' or 'torrent-added'
+        torrent = torrent or self.create_torrent(**kwargs)
+
+        return 'success', {key: {'id': torrent.id, 'name': torrent.name, 'hashString': torrent.hash}}
+
+    def torrent_set(self, ids=None, **arguments):
+        return 'success', {}
+
+    def torrent_stop(self, ids=None, **arguments):
+        for torrent in self.select(ids):
+            torrent.stopped = True
+
+        return 'success', {}
@@ -0,0 +1,163 @@
+"""
+Benchmarks of the torrents app. They are skipped unless BENCHMARKS environment
+variable is set, since they run thousands of torrents against FakeTransmission:
+
+    $ BENCHMARKS=1 python manage.py test torrents.tests.test_benchmarks
+
+Queries and RPC requests are asserted against budgets which don't grow with
+the number of files. Parsing is asserted against a generous time limit.
+"""
+
+import math
+import os
+import time
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connection, reset_queries
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from kuzgun.utils import redis
+from ..bencode import decode, encode, parse_metainfo
+from ..models import Torrent
+from ..serializers import TorrentSerializer
+from ..tasks import monitor_torrents, update_and_save_information, BATCH_SIZE, MONITOR_LOCK, TORRENT_SCHEDULE
+from ..utils import LazyTransmissionRPC
+from .fake_transmission import completed, linear, FakeTransmission
+
+BENCHMARKS = os.environ.get('BENCHMARKS')
+FILE_COUNT = 10000
+ROUNDS = 10
+MAX_PARSE_SECONDS = 1  # per round of FILE_COUNT files
+TORRENT_COUNT = 2000
+FINISHED_COUNT = 10
+FINISHED_FILE_COUNT = 1000
+FINISH_QUERIES = 16  # per finished torrent, whatever its file count is
+FINISH_REQUESTS = 2  # RPC requests per finished torrent
+
+
+def create_metainfo(name, file_count):
+    """
+    Creates .torrent data of a synthetic torrent with file_count files.
+
+    :param name: Torrent name
+    :param file_count: int
+    :return: bytes
+    """
+    return encode({
+        'announce': 'http://tracker.example.com/announce',
+        'info': {
+            'name': name,
+            'piece length': 4 * 1024 * 1024,
+            'pieces': b'\x00' * 20 * file_count,
+            'files': [
+                {'path': ['Season {:02d}'.format(i // 100), '{}.E{:05d}.mkv'.format(name, i)], 'length': 1024 * i}
+                for i in range(file_count)
+            ],
+        },
+    })
+
+
+@skipUnless(BENCHMARKS, 'Set BENCHMARKS environment variable to run benchmarks.')
+class BencodeBenchmarks(SimpleTestCase):
+    """
+    Benchmarks of bencode decoder and metainfo parser.
+    """
+    def setUp(self):
+        self.data = create_metainfo('Sample', FILE_COUNT)
+
+    def _benchmark(self, func):
+        start = time.perf_counter()
+
+        for _ in range(ROUNDS):
+            result = func(self.data)
+
+        self.assertLess((time.perf_counter() - start) / ROUNDS, MAX_PARSE_SECONDS)
+
+        return result
+
+    def test_decode(self):
+        metainfo = self._benchmark(decode)
+        self.assertEqual(len(metainfo[b'info'][b'files']), FILE_COUNT)
+
+    def test_parse_metainfo(self):
+        metainfo = self._benchmark(parse_metainfo)
+        self.assertEqual(len(metainfo.files), FILE_COUNT)
+
+
+@skipUnless(BENCHMARKS, 'Set BENCHMARKS environment variable to run benchmarks.')
+class TorrentTaskBenchmarks(TestCase):
+    """
+    End to end benchmarks of the torrent tasks against FakeTransmission.
+    Requires redis like the application does.
+    """
+    def setUp(self):
+        self.fake = FakeTransmission()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+
+        transmission = LazyTransmissionRPC(self.fake.address, port=self.fake.port, user='admin', password='admin')
+        patcher = patch('torrents.tasks.transmission', transmission)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        redis.delete(MONITOR_LOCK, TORRENT_SCHEDULE)
+        self.addCleanup(redis.delete, MONITOR_LOCK, TORRENT_SCHEDULE)
+
+    def _benchmark(self, func, *args):
+        """
+        Runs func and counts its queries and RPC requests.
+
+        :return: tuple: result of func, number of queries and RPC requests.
+        """
+        reset_queries()  # Captured queries are wrong once the query log of the connection is full.
+        request_count = self.fake.request_count
+
+        with CaptureQueriesContext(connection) as context:
+            result = func(*args)
+
+        return result, len(context.captured_queries), self.fake.request_count - request_count
+
+    def create_torrents(self, count, **kwargs):
+        hashes = self.fake.create_torrents(count, **kwargs)
+        Torrent.objects.bulk_create(Torrent(hash=info_hash, name=info_hash, added=True) for info_hash in hashes)
+
+    def test_monitor_torrents(self):
+        batches = math.ceil(TORRENT_COUNT / BATCH_SIZE)
+        self.create_torrents(TORRENT_COUNT, curve=linear(3600))
+
+        # A get_torrents request and a bulk update per batch. First run requests the session too.
+        _, queries, requests = self._benchmark(monitor_torrents)
+        self.assertLessEqual(queries, batches + 3)
+        self.assertLessEqual(requests, batches + 2)
+
+        redis.delete(TORRENT_SCHEDULE)
+        _, queries, requests = self._benchmark(monitor_torrents)
+        self.assertLessEqual(queries, batches + 3)
+        self.assertEqual(requests, batches)
+
+        # None of the torrents is due.
+        _, queries, requests = self._benchmark(monitor_torrents)
+        self.assertEqual(queries, 0)
+        self.assertEqual(requests, 0)
+
+    def test_update_and_save_information(self):
+        self.create_torrents(FINISHED_COUNT, file_count=FINISHED_FILE_COUNT, curve=completed())
+
+        def finish_torrents():
+            for torrent_model in Torrent.objects.all():
+                update_and_save_information(torrent_model.pk)
+
+        _, queries, requests = self._benchmark(finish_torrents)
+        self.assertLessEqual(queries, FINISHED_COUNT * FINISH_QUERIES)
+        self.assertLessEqual(requests, FINISHED_COUNT * FINISH_REQUESTS + 2)
+        self.assertEqual(Torrent.objects.filter(finished=True).count(), FINISHED_COUNT)
+
+    def test_serialize_torrents(self):
+        self.create_torrents(TORRENT_COUNT, curve=linear(3600))
+        monitor_torrents()
+
+        data, queries, _ = self._benchmark(lambda: TorrentSerializer(Torrent.objects.all(), many=True).data)
+        self.assertEqual(len(data), TORRENT_COUNT)
+        self.assertEqual(queries, 1)
@@ -0,0 +1,91 @@
+import hashlib
+
+from django.test import SimpleTestCase
+
+from ..bencode import decode, encode, parse_metainfo, BencodeError, MAX_DEPTH
+
+
+class BencodeTests(SimpleTestCase):
+    """
+    Unit tests for bencode decoder and metainfo parser.
+    """
+    def setUp(self):
+        self.info = {
+            'name': 'Sample',
+            'piece length': 16384,
+            'pieces': b'\x00' * 20,
+            'private': 1,
+            'files': [
+                {'path': ['Season 1', 'Sample.E01.avi'], 'length': 1024},
+                {'path': ['Sample.srt'], 'length': 16},
+            ],
+        }
+        self.data = encode({'announce': 'http://tracker.example.com/announce', 'info': self.info})
+
+    def test_decode(self):
+        self.assertEqual(decode(b'd4:listli1ei-2e3:abce3:numi42ee'), {b'list': [1, -2, b'abc'], b'num': 42})
+        self.assertEqual(decode(encode(self.info))[b'files'][0][b'length'], 1024)
+
+    def test_encode_that_empty_strings(self):
+        self.assertEqual(encode({'': ''}), b'd0:0:e')
+        self.assertEqual(decode(encode(['', b''])), [b'', b''])
+
+    def test_decode_that_raise_bencode_error(self):
+        for data in (b'', b'i42', b'5:abc', b'l1:a', b'x', b'i1ei2e', b'di1ei2ee', b'd1:ae', b'iae',
+                     b'-1:a', b' 1:a', b'+1:a', b'i 5e', b'i1_0e', b'ie'):
+            with self.assertRaises(BencodeError):
+                decode(data)
+
+    def test_decode_that_raise_bencode_error_for_deep_nesting(self):
+        value = decode(b'l' * MAX_DEPTH + b'e' * MAX_DEPTH)
+
+        for _ in range(MAX_DEPTH - 1):
+            value = value[0]
+
+        self.assertEqual(value, [])
+
+        for data in (b'l' * 5000, b'l' * 5000 + b'e' * 5000, b'd1:a' * 5000):
+            with self.assertRaises(BencodeError):
+                decode(data)
+
+        with self.assertRaises(BencodeError):
+            parse_metainfo(b'd4:info' + b'l' * 5000 + b'e' * 5001)
+
+    def test_parse_metainfo(self):
+        metainfo = parse_metainfo(self.data)
+
+        self.assertEqual(metainfo.info_hash, hashlib.sha1(encode(self.info)).hexdigest())
+        self.assertEqual(metainfo.name, 'Sample')
+        self.assertEqual(metainfo.size, 1040)
+        self.assertListEqual(metainfo.files, [('Sample/Season 1/Sample.E01.avi', 1024), ('Sample/Sample.srt', 16)])
+        self.assertTrue(metainfo.private)
+
+    def test_parse_metainfo_that_single_file(self):
+        metainfo = parse_metainfo(encode({'info': {'name': 'sample.avi', 'length': 2048}}))
+
+        self.assertListEqual(metainfo.files, [('sample.avi', 2048)])
+        self.assertFalse(metainfo.private)
+
+    def test_parse_metainfo_that_utf8_name(self):
+        metainfo = parse_metainfo(encode({'info': {'name.utf-8': 'örnek.avi', 'length': 2048}}))
+
+        self.assertEqual(metainfo.name, 'örnek.avi')
+
+    def test_parse_metainfo_that_raise_bencode_error_for_missing_name(self):
+        for info in ({'length': 1}, {'files': [{'path': ['a'], 'length': 1}]}):
+            with self.assertRaises(BencodeError):
+                parse_metainfo(encode({'info': info}))
+
+    def test_parse_metainfo_that_raise_bencode_error_for_invalid_length(self):
+        for info in (
+            {'name': 'a', 'length': 'x'},
+            {'name': 'a', 'length': -1},
+            {'name': 'a', 'files': [{'path': ['b'], 'length': 1}, {'path': ['c'], 'length': [1]}]},
+        ):
+            with self.assertRaises(BencodeError):
+                parse_metainfo(encode({'info': info}))
+
+    def test_parse_metainfo_that_raise_bencode_error(self):
+        for data in (b'li1ee', encode({'announce': 'x'}), encode({'info': {'length': 1}})):
+            with self.assertRaises(BencodeError):
+                parse_metainfo(data)
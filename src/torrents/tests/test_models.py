@@ -0,0 +1,39 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ..enums import Status
+from ..models import Torrent
+
+
+class TorrentModelTests(TestCase):
+    """
+    Unit tests for Torrent model.
+    """
+    def setUp(self):
+        Torrent.objects.create(hash='63b024bf50a50ca95f1b2364a946faf8', name='sample.avi')
+        self.torrent_model = Torrent.objects.get(hash='63b024bf50a50ca95f1b2364a946faf8')
+
+    def test_save_changes_that_nothing_changed(self):
+        self.torrent_model.progress = 0.001
+        self.torrent_model.status = Status.IN_QUEUE
+
+        self.assertListEqual(self.torrent_model.get_changed_fields(), [])
+
+        with self.assertNumQueries(0):
+            self.assertFalse(self.torrent_model.save_changes())
+
+    def test_save_changes_that_save_changed_fields(self):
+        self.torrent_model.status = Status.DOWNLOADING
+        self.torrent_model.progress = 45.9712
+
+        self.assertListEqual(self.torrent_model.get_changed_fields(), ['status', 'progress'])
+
+        with self.assertNumQueries(1):
+            self.assertTrue(self.torrent_model.save_changes())
+
+        self.assertListEqual(self.torrent_model.get_changed_fields(), [])
+
+        torrent_model = Torrent.objects.get(pk=self.torrent_model.pk)
+        self.assertEqual(torrent_model.status, Status.DOWNLOADING)
+        self.assertEqual(torrent_model.progress, Decimal('45.97'))
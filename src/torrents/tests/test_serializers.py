@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from ..models import Torrent, TORRENT_HASH
+from ..serializers import TorrentSerializer
+
+
+class TorrentSerializerTests(TestCase):
+    """
+    Unit tests for Torrent serializers.
+    """
+    def setUp(self):
+        self.torrent_models = [
+            Torrent.objects.create(hash='63b024bf50a50ca95f1b2364a946faf{}'.format(i), name='sample.{}'.format(i))
+            for i in range(3)
+        ]
+
+    @patch('torrents.serializers.redis')
+    def test_list_serializer_that_fetch_rates_in_one_pipeline(self, mock_redis):
+        mock_pipeline = mock_redis.pipeline.return_value
+        mock_pipeline.execute.return_value = [[b'10500', b'105000'], [None, None], [b'0', b'2048']]
+
+        data = TorrentSerializer(self.torrent_models, many=True).data
+
+        mock_redis.pipeline.assert_called_once_with(transaction=False)
+        self.assertEqual(mock_pipeline.hmget.call_count, 3)
+        mock_pipeline.hmget.assert_any_call(
+            TORRENT_HASH.format(self.torrent_models[0].pk), 'rate_upload', 'rate_download'
+        )
+        mock_redis.hmget.assert_not_called()
+        self.assertListEqual(
+            [(item['rate_upload'], item['rate_download']) for item in data], [(10500, 105000), (0, 0), (0, 2048)]
+        )
+
+    @patch('torrents.serializers.redis')
+    def test_serializer_that_fetch_rates_once(self, mock_redis):
+        mock_redis.hmget.return_value = [b'10500', b'105000']
+
+        data = TorrentSerializer(self.torrent_models[0]).data
+
+        mock_redis.hmget.assert_called_once_with(
+            TORRENT_HASH.format(self.torrent_models[0].pk), 'rate_upload', 'rate_download'
+        )
+        self.assertEqual(data['rate_upload'], 10500)
+        self.assertEqual(data['rate_download'], 105000)
@@ -0,0 +1,73 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from files.enums import Volume
+from files.models import File
+from kuzgun.utils import get_user_version
+from ..models import Torrent
+
+
+class TorrentSignalTests(TestCase):
+    """
+    Unit tests for Torrent signals.
+    """
+    def setUp(self):
+        self.torrent_model = Torrent.objects.create(hash='63b024bf50a50ca95f1b2364a946faf8', name='sample')
+        self.users = [
+            get_user_model().objects.create_user(username, '{}@doe.com'.format(username), username)
+            for username in ('johndoe', 'janedoe')
+        ]
+        self.files = [
+            File.objects.create(volume=Volume.TORRENT, path='sample/sample.{}'.format(ext))
+            for ext in ('avi', 'srt', 'nfo')
+        ]
+
+        for user in self.users:
+            user.torrents.add(self.torrent_model)
+
+    def test_link_to_users(self):
+        self.users[0].files.add(self.files[0])
+
+        self.torrent_model.files.add(*self.files)
+
+        for user in self.users:
+            self.assertSetEqual(set(user.files.all()), set(self.files))
+
+
+class TorrentVersionSignalTests(TransactionTestCase):
+    """
+    Unit tests for version stamps bumped by Torrent signals.
+    """
+    def setUp(self):
+        self.torrent_model = Torrent.objects.create(hash='63b024bf50a50ca95f1b2364a946faf8', name='sample')
+        self.user = get_user_model().objects.create_user('johndoe', 'john@doe.com', 'johndoe')
+        self.user.torrents.add(self.torrent_model)
+
+    def test_link_to_users_that_bump_versions_on_commit(self):
+        version = get_user_version(self.user.pk)
+
+        with transaction.atomic():
+            self.torrent_model.files.add(File.objects.create(volume=Volume.TORRENT, path='sample/sample.avi'))
+
+            # Readers can't see the new files yet, so they must not see a new stamp either.
+            self.assertEqual(get_user_version(self.user.pk), version)
+
+        self.assertNotEqual(get_user_version(self.user.pk), version)
+
+    def test_save_that_bump_versions_on_commit(self):
+        version = get_user_version(self.user.pk)
+
+        # Tasks publish the changes they save with save_changes().
+        with self.assertNumQueries(1):
+            self.torrent_model.progress = 50
+            self.torrent_model.save_changes()
+
+        self.assertEqual(get_user_version(self.user.pk), version)
+
+        with transaction.atomic():
+            self.torrent_model.name = 'renamed'
+            self.torrent_model.save()
+            self.assertEqual(get_user_version(self.user.pk), version)
+
+        self.assertNotEqual(get_user_version(self.user.pk), version)
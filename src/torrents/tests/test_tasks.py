@@ -1,18 +1,27 @@
+import base64
+import hashlib
+import time
 from collections import namedtuple
+from datetime import timedelta
 from decimal import Decimal
-from unittest.mock import patch
+from unittest.mock import call, patch
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
 from django.utils import timezone
 
 from files.enums import Volume
 from files.models import File
+from kuzgun.utils import redis
+from ..bencode import decode, encode
+from ..enums import Status
 from ..models import Torrent, TORRENT_HASH
-from ..tasks import update_and_save_information, update_and_stop_seeding, COUNTDOWN
-
-
-def mock_stop():
-    pass
+from ..tasks import (
+    add_torrent, get_poll_interval, monitor_torrents, stop_seeding_torrents, update_and_save_information,
+    COUNTDOWN, DONE_SCRIPT_COUNTDOWN, FINISH_LOCK, MAX_COUNTDOWN, MIN_COUNTDOWN, MONITOR_LOCK, MONITOR_LOCK_TIMEOUT,
+    SEEDING_HOURS, TORRENT_SCHEDULE
+)
+from ..utils import TransmissionError, TransmissionUnavailable, FINISH_FIELDS, POLL_FIELDS, RESET_TIMEOUT, SEED_FIELDS
 
 
 class TorrentTaskTest(TestCase):
@@ -22,18 +31,25 @@ class TorrentTaskTest(TestCase):
     def setUp(self):
         self.file = File.objects.create(volume=Volume.DATA, path='drop.avi')
         self.file_mp4 = File.objects.create(volume=Volume.DATA, path='drop.mp4')
-        self.torrent = namedtuple('torrent', ['status', 'progress', 'ratio', 'rateUpload', 'rateDownload', 'stop'])
+        self.torrent = namedtuple('torrent', [
+            'hashString', 'status', 'progress', 'ratio', 'rateUpload', 'rateDownload', 'eta', 'stop'
+        ])
+        self.seed_torrent = namedtuple('torrent', ['id', 'hashString', 'status', 'ratio', 'rateUpload'])
+        self.added_torrent = namedtuple('torrent', ['id', 'hashString', 'name'])
         self.torrent_model = Torrent.objects.create(
             hash='63b024bf50a50ca95f1b2364a946faf8',
-            name='sample.avi'
+            name='sample.avi',
+            added=True
         )
 
-    def _apply_common_assertions(self, mock_get_torrent, mock_hmset):
-        mock_get_torrent.assert_called_with(self.torrent_model.hash)
-        self.assertTrue(mock_hmset.has_called_with(TORRENT_HASH.format(self.torrent_model.pk), {
-            'rate_upload': mock_get_torrent.rateUpload,
-            'rate_download': mock_get_torrent.rateDownload
-        }))
+    def _apply_common_assertions(self, mock_get_torrent, mock_pipeline, rate_upload, rate_download):
+        mock_get_torrent.assert_any_call(self.torrent_model.hash, arguments=POLL_FIELDS)
+        mock_pipeline.return_value.hmset.assert_called_once_with(TORRENT_HASH.format(self.torrent_model.pk), {
+            'rate_upload': rate_upload,
+            'rate_download': rate_download,
+            'progress': self.torrent_model.progress,
+        })
+        mock_pipeline.return_value.execute.assert_called_once_with()
 
     def test_update_and_save_information_that_except_does_not_exist(self):
         torrent_id = 99999
@@ -41,113 +57,402 @@ class TorrentTaskTest(TestCase):
 
         self.assertIsNone(result)
 
-    @patch('torrents.tasks.update_and_save_information.apply_async')
-    @patch('torrents.tasks.redis.hmset')
+    @patch('torrents.utils.redis.pipeline')
     @patch('torrents.tasks.transmission.get_torrent')
-    def test_update_and_save_information_that_return_apply_async(self, mock_get_torrent, mock_hmset, mock_apply_async):
+    def test_update_and_save_information_that_save_and_return_none(self, mock_get_torrent, mock_pipeline):
         mock_get_torrent.return_value = self.torrent(
+            hashString=self.torrent_model.hash,
             status='downloading',
             progress=Decimal('45.97'),
             ratio=Decimal('9.99'),
             rateUpload=10500,
             rateDownload=105000,
+            eta=None,
             stop=None
         )
 
-        update_and_save_information(self.torrent_model.pk)
+        self.assertIsNone(update_and_save_information(self.torrent_model.pk))
 
-        self._apply_common_assertions(mock_get_torrent, mock_hmset)
-        mock_get_torrent.assert_called_with(self.torrent_model.hash)
-        mock_apply_async.assert_called_with((self.torrent_model.pk,), countdown=COUNTDOWN)
+        self.torrent_model.refresh_from_db()
+        self._apply_common_assertions(mock_get_torrent, mock_pipeline, 10500, 105000)
+        self.assertEqual(self.torrent_model.status, Status.DOWNLOADING)
+        self.assertEqual(self.torrent_model.progress, Decimal('45.97'))
 
     @patch('torrents.tasks.create_from_torrent')
-    @patch('torrents.tasks.update_and_stop_seeding.delay')
-    @patch('torrents.tasks.redis.hmset')
+    @patch('torrents.utils.redis.pipeline')
     @patch('torrents.tasks.transmission.get_torrent')
     def test_update_and_save_information_that_return_none(
-            self, mock_get_torrent, mock_hmset,
-            mock_update_and_stop_seeding_delay,
-            mock_create_from_torrent
+            self, mock_get_torrent, mock_pipeline, mock_create_from_torrent
     ):
         mock_create_from_torrent.return_value = (self.file, self.file_mp4)
 
-        mock_get_torrent.return_value = self.torrent(
+        torrent = self.torrent(
+            hashString=self.torrent_model.hash,
             status='downloading',
             progress=Decimal('100.00'),
             ratio=Decimal('9.99'),
             rateUpload=10500,
             rateDownload=105000,
+            eta=None,
             stop=None
         )
+        finished_torrent = namedtuple('torrent', self.torrent._fields + ('name', 'isPrivate'))
+        mock_get_torrent.side_effect = [torrent, finished_torrent(*torrent, name='Sample', isPrivate=True)]
 
         update_and_save_information(self.torrent_model.pk)
 
-        self._apply_common_assertions(mock_get_torrent, mock_hmset)
-        mock_get_torrent.assert_called_with(self.torrent_model.hash)
-        mock_update_and_stop_seeding_delay.assert_called_with(self.torrent_model.pk)
+        self.torrent_model.refresh_from_db()
+        self._apply_common_assertions(mock_get_torrent, mock_pipeline, 0, 0)
+        mock_get_torrent.assert_called_with(self.torrent_model.hash, arguments=FINISH_FIELDS)
+        self.assertTrue(self.torrent_model.finished)
+        self.assertTrue(self.torrent_model.private)
+        self.assertEqual(self.torrent_model.name, 'Sample')
 
-    def test_update_and_stop_seeding_that_except_does_not_exist(self):
-        torrent_id = 99999
-        result = update_and_stop_seeding(torrent_id)
+    @patch('torrents.tasks.create_from_torrent')
+    @patch('torrents.tasks.transmission.get_torrent')
+    def test_update_and_save_information_that_transmission_is_unavailable_while_finishing(
+            self, mock_get_torrent, mock_create_from_torrent
+    ):
+        torrent = self.torrent(
+            hashString=self.torrent_model.hash,
+            status='seeding',
+            progress=Decimal('100.00'),
+            ratio=Decimal('0.10'),
+            rateUpload=0,
+            rateDownload=0,
+            eta=None,
+            stop=None
+        )
+        mock_get_torrent.side_effect = [torrent, TransmissionUnavailable('Transmission is unavailable.')]
+        redis.set(FINISH_LOCK.format(self.torrent_model.pk), 1)
 
-        self.assertIsNone(result)
+        self.assertIsNone(update_and_save_information(self.torrent_model.pk))
 
-    @patch('torrents.tasks.update_and_stop_seeding.apply_async')
-    @patch('torrents.tasks.redis.hset')
-    @patch('torrents.tasks.transmission.get_torrent')
-    def test_update_and_stop_seeding_that_return_apply_async(self, mock_get_torrent, mock_hset, mock_apply_async):
-        mock_get_torrent.return_value = self.torrent(
+        self.torrent_model.refresh_from_db()
+        mock_create_from_torrent.assert_not_called()
+        self.assertFalse(self.torrent_model.finished)
+        self.assertFalse(redis.exists(FINISH_LOCK.format(self.torrent_model.pk)))
+
+    @patch('torrents.tasks.update_and_save_information.delay')
+    @patch('torrents.utils.redis.pipeline')
+    @patch('torrents.tasks.redis')
+    @patch('torrents.tasks.transmission.get_torrents')
+    def test_monitor_torrents(
+            self, mock_get_torrents, mock_redis, mock_pipeline, mock_update_and_save_information_delay
+    ):
+        completed_torrent_model = Torrent.objects.create(
+            hash='fe8d8df9b015e44eccf5f58b210095ea9e0a046d',
+            name='Telephone_Operator.avi',
+            added=True
+        )
+        missing_torrent_model = Torrent.objects.create(
+            hash='3f19b149f53a50e14fc0b79926a391896eabab6f',
+            name='Missing.avi',
+            added=True
+        )
+
+        mock_redis.zrangebyscore.return_value = [
+            str(self.torrent_model.pk), str(completed_torrent_model.pk), str(missing_torrent_model.pk), '0'
+        ]
+        mock_get_torrents.return_value = [
+            self.torrent(
+                hashString=self.torrent_model.hash,
+                status='download pending',
+                progress=Decimal('45.97'),
+                ratio=Decimal('0.12'),
+                rateUpload=10500,
+                rateDownload=105000,
+                eta=None,
+                stop=None
+            ),
+            self.torrent(
+                hashString=completed_torrent_model.hash,
+                status='seeding',
+                progress=Decimal('100.00'),
+                ratio=Decimal('0.00'),
+                rateUpload=0,
+                rateDownload=0,
+                eta=None,
+                stop=None
+            ),
+        ]
+
+        self.assertIsNone(monitor_torrents())
+
+        self.assertEqual(mock_get_torrents.call_count, 1)
+        self.assertEqual(mock_get_torrents.call_args[1], {'arguments': POLL_FIELDS})
+        self.assertCountEqual(
+            mock_get_torrents.call_args[0][0],
+            [self.torrent_model.hash, completed_torrent_model.hash, missing_torrent_model.hash]
+        )
+        mock_update_and_save_information_delay.assert_called_once_with(completed_torrent_model.pk)
+
+        # Due torrents are selected from the schedule and deleted ones are removed from it.
+        self.assertEqual(mock_redis.zrangebyscore.call_args[0][:2], (TORRENT_SCHEDULE, '-inf'))
+        mock_redis.zrem.assert_called_once_with(TORRENT_SCHEDULE, '0')
+
+        # Torrents which don't exist in transmission are polled again after MAX_COUNTDOWN.
+        schedule = mock_redis.zadd.call_args[1]
+        self.assertGreater(schedule[str(missing_torrent_model.pk)], time.time() + MAX_COUNTDOWN - 5)
+        self.assertEqual(mock_pipeline.return_value.hmset.call_count, 2)
+        mock_pipeline.return_value.execute.assert_called_once_with()
+
+        self.torrent_model.refresh_from_db()
+        self.assertEqual(self.torrent_model.status, Status.IN_QUEUE)
+        self.assertEqual(self.torrent_model.progress, Decimal('45.97'))
+        self.assertEqual(self.torrent_model.ratio, Decimal('0.12'))
+
+    @patch('torrents.tasks.transmission.get_torrents')
+    def test_monitor_torrents_that_schedule_unfinished_torrents(self, mock_get_torrents):
+        # Pending magnet keeps its info hash, but it isn't added to transmission yet.
+        Torrent.objects.create(hash='fe8d8df9b015e44eccf5f58b210095ea9e0a046d', name='pending')
+        redis.delete(TORRENT_SCHEDULE)
+        self.addCleanup(redis.delete, TORRENT_SCHEDULE)
+        mock_get_torrents.return_value = []
+
+        self.assertIsNone(monitor_torrents())
+        self.assertListEqual(mock_get_torrents.call_args[0][0], [self.torrent_model.hash])
+        self.assertGreater(redis.zscore(TORRENT_SCHEDULE, self.torrent_model.pk), time.time())
+
+        # The torrent isn't polled again until it's due.
+        self.assertIsNone(monitor_torrents())
+        self.assertEqual(mock_get_torrents.call_count, 1)
+
+    @override_settings(TORRENT_DONE_TOKEN=None)
+    def test_get_poll_interval(self):
+        torrent = self.torrent(
+            hashString=self.torrent_model.hash,
             status='downloading',
-            progress=Decimal('100.00'),
-            ratio=Decimal('9.99'),
-            rateUpload=10500,
+            progress=Decimal('99.00'),
+            ratio=Decimal('0.00'),
+            rateUpload=0,
             rateDownload=105000,
+            eta=timedelta(seconds=1),
             stop=None
         )
 
-        update_and_stop_seeding(self.torrent_model.pk)
-
-        mock_get_torrent.assert_called_with(self.torrent_model.hash)
-        mock_hset.assert_called_with(
-            'torrent:{}'.format(self.torrent_model.pk), 'rate_upload', mock_get_torrent.return_value.rateUpload
+        self.torrent_model.status = Status.DOWNLOADING
+        self.assertEqual(get_poll_interval(self.torrent_model, torrent), MIN_COUNTDOWN)
+        self.assertEqual(
+            get_poll_interval(self.torrent_model, torrent._replace(eta=timedelta(hours=1))), COUNTDOWN * 2
         )
-        mock_apply_async.assert_called_with((self.torrent_model.pk,), countdown=COUNTDOWN)
+        self.assertEqual(get_poll_interval(self.torrent_model, torrent._replace(eta=None)), COUNTDOWN)
 
-    @patch('torrents.tasks.redis.hset')
-    @patch('torrents.tasks.transmission.get_torrent')
-    def test_update_and_stop_seeding_that_stopped_return_none(self, mock_get_torrent, mock_hset):
-        mock_get_torrent.return_value = self.torrent(
-            status='stopped',
-            progress=Decimal('100.00'),
-            ratio=Decimal('9.99'),
-            rateUpload=10500,
+        self.torrent_model.poll_interval = MAX_COUNTDOWN
+        self.assertEqual(get_poll_interval(self.torrent_model, torrent._replace(rateDownload=0)), MAX_COUNTDOWN)
+
+        self.torrent_model.poll_interval = COUNTDOWN
+        self.torrent_model.status = Status.CHECK_PENDING
+        self.assertEqual(get_poll_interval(self.torrent_model, torrent), COUNTDOWN * 2)
+
+    @override_settings(TORRENT_DONE_TOKEN='secret')
+    def test_get_poll_interval_that_torrent_done_script_is_enabled(self):
+        torrent = self.torrent(
+            hashString=self.torrent_model.hash,
+            status='downloading',
+            progress=Decimal('99.00'),
+            ratio=Decimal('0.00'),
+            rateUpload=0,
             rateDownload=105000,
-            stop=mock_stop
+            eta=timedelta(seconds=1),
+            stop=None
         )
 
-        self.assertIsNone(update_and_stop_seeding(self.torrent_model.pk))
+        self.torrent_model.status = Status.DOWNLOADING
+        self.assertEqual(get_poll_interval(self.torrent_model, torrent), MAX_COUNTDOWN)
+        self.assertEqual(
+            get_poll_interval(self.torrent_model, torrent._replace(eta=timedelta(hours=1))), DONE_SCRIPT_COUNTDOWN
+        )
+        self.assertEqual(get_poll_interval(self.torrent_model, torrent._replace(eta=None)), MAX_COUNTDOWN)
 
-        mock_get_torrent.assert_called_with(self.torrent_model.hash)
-        mock_hset.assert_called_with(
-            'torrent:{}'.format(self.torrent_model.pk), 'rate_upload', 0
+        self.torrent_model.poll_interval = MAX_COUNTDOWN * 4
+        self.assertEqual(
+            get_poll_interval(self.torrent_model, torrent._replace(rateDownload=0)), DONE_SCRIPT_COUNTDOWN
         )
 
-    @patch('torrents.tasks.redis.hset')
-    @patch('torrents.tasks.transmission.get_torrent')
-    def test_update_and_stop_seeding_that_seeding_return_none(self, mock_get_torrent, mock_hset):
-        mock_get_torrent.return_value = self.torrent(
-            status='seeding',
-            progress=Decimal('100.00'),
-            ratio=Decimal('9.99'),
-            rateUpload=10500,
-            rateDownload=105000,
-            stop=mock_stop
+    @patch('torrents.tasks.transmission.get_torrents')
+    def test_monitor_torrents_that_already_running(self, mock_get_torrents):
+        lock = redis.lock(MONITOR_LOCK, timeout=MONITOR_LOCK_TIMEOUT)
+        self.assertTrue(lock.acquire(blocking=False))
+        self.addCleanup(redis.delete, MONITOR_LOCK)
+
+        self.assertIsNone(monitor_torrents())
+        mock_get_torrents.assert_not_called()
+
+        # Lock of the running one is kept, so it can still release it.
+        lock.release()
+
+    @patch('torrents.tasks.transmission.get_torrents')
+    def test_monitor_torrents_that_does_not_release_lock_of_another_run(self, mock_get_torrents):
+        redis.delete(TORRENT_SCHEDULE)
+        self.addCleanup(redis.delete, MONITOR_LOCK, TORRENT_SCHEDULE)
+
+        def expire_and_lock_again(*args, **kwargs):
+            # Lock of this run expires and another run takes it.
+            redis.delete(MONITOR_LOCK)
+            redis.set(MONITOR_LOCK, 'another', ex=MONITOR_LOCK_TIMEOUT)
+            return []
+
+        mock_get_torrents.side_effect = expire_and_lock_again
+
+        self.assertIsNone(monitor_torrents())
+        self.assertEqual(redis.get(MONITOR_LOCK), 'another')
+
+    @patch('torrents.utils.redis.pipeline')
+    @patch('torrents.tasks.transmission.stop_torrent')
+    @patch('torrents.tasks.transmission.get_torrents')
+    def test_stop_seeding_torrents(self, mock_get_torrents, mock_stop_torrent, mock_pipeline):
+        seeding_torrent_model = Torrent.objects.create(
+            hash='fe8d8df9b015e44eccf5f58b210095ea9e0a046d',
+            name='Telephone_Operator.avi',
+            finished=True,
+            status=Status.SEEDING
         )
+        expired_torrent_model = Torrent.objects.create(
+            hash='3f19b149f53a50e14fc0b79926a391896eabab6f',
+            name='Night_of_the_Living_Dead.avi',
+            finished=True,
+            status=Status.SEEDING
+        )
+        expired_torrent_model.created = timezone.now() + timezone.timedelta(hours=-SEEDING_HOURS, seconds=-1)
+        expired_torrent_model.save()
+
+        mock_get_torrents.return_value = [
+            self.seed_torrent(
+                id=1, hashString=seeding_torrent_model.hash, status='seeding', ratio=Decimal('0.50'), rateUpload=10500
+            ),
+            self.seed_torrent(
+                id=2, hashString=expired_torrent_model.hash, status='seeding', ratio=Decimal('1.20'), rateUpload=10500
+            ),
+        ]
+
+        self.assertIsNone(stop_seeding_torrents())
 
-        self.torrent_model.created = timezone.now() + timezone.timedelta(hours=-24, seconds=-1)
+        self.assertEqual(mock_get_torrents.call_count, 1)
+        self.assertEqual(mock_get_torrents.call_args[1], {'arguments': SEED_FIELDS})
+        mock_stop_torrent.assert_called_once_with([2])
+        mock_pipeline.return_value.hmset.assert_has_calls([
+            call(TORRENT_HASH.format(seeding_torrent_model.pk), {'rate_upload': 10500}),
+            call(TORRENT_HASH.format(expired_torrent_model.pk), {'rate_upload': 0}),
+        ], any_order=True)
+        mock_pipeline.return_value.execute.assert_called_once_with()
+
+        seeding_torrent_model.refresh_from_db()
+        self.assertEqual(seeding_torrent_model.status, Status.SEEDING)
+        self.assertEqual(seeding_torrent_model.ratio, Decimal('0.50'))
+
+        expired_torrent_model.refresh_from_db()
+        self.assertEqual(expired_torrent_model.status, Status.STOPPED)
+        self.assertEqual(expired_torrent_model.ratio, Decimal('1.20'))
+
+    @patch('torrents.utils.redis.pipeline')
+    @patch('torrents.tasks.transmission.stop_torrent')
+    @patch('torrents.tasks.transmission.get_torrents')
+    def test_stop_seeding_torrents_that_stopped_by_transmission(
+            self, mock_get_torrents, mock_stop_torrent, mock_pipeline
+    ):
+        self.torrent_model.finished = True
+        self.torrent_model.status = Status.SEEDING
         self.torrent_model.save()
 
-        self.assertIsNone(update_and_stop_seeding(self.torrent_model.pk))
+        mock_get_torrents.return_value = [
+            self.seed_torrent(
+                id=1, hashString=self.torrent_model.hash, status='stopped', ratio=Decimal('2.00'), rateUpload=0
+            ),
+        ]
+
+        self.assertIsNone(stop_seeding_torrents())
+
+        mock_stop_torrent.assert_not_called()
+        mock_pipeline.return_value.hmset.assert_called_once_with(
+            TORRENT_HASH.format(self.torrent_model.pk), {'rate_upload': 0}
+        )
+
+        self.torrent_model.refresh_from_db()
+        self.assertEqual(self.torrent_model.status, Status.STOPPED)
+
+    @patch('torrents.tasks.transmission.add_torrent')
+    def test_add_torrent(self, mock_add_torrent):
+        torrent_model = Torrent.objects.create(name='Telephone_Operator.avi')
+        mock_add_torrent.return_value = self.added_torrent(
+            id=1, hashString='fe8d8df9b015e44eccf5f58b210095ea9e0a046d', name='Telephone Operator'
+        )
+
+        add_torrent(torrent_model.pk, 'magnet:?xt=urn:btih:fe8d8df9b015e44eccf5f58b210095ea9e0a046d')
+
+        torrent_model.refresh_from_db()
+        self.assertEqual(torrent_model.hash, 'fe8d8df9b015e44eccf5f58b210095ea9e0a046d')
+        self.assertTrue(torrent_model.added)
+        self.assertEqual(torrent_model.name, 'Telephone Operator')
+
+    @patch('torrents.tasks.transmission.add_torrent')
+    def test_add_torrent_that_merge_into_duplicate(self, mock_add_torrent):
+        user = get_user_model().objects.create_user('johndoe', 'john@doe.com', 'johndoe')
+        torrent_model = Torrent.objects.create(name='sample')
+        user.torrents.add(torrent_model)
+        mock_add_torrent.return_value = self.added_torrent(id=1, hashString=self.torrent_model.hash, name='sample')
+
+        add_torrent(torrent_model.pk, 'magnet:?xt=urn:btih:{}'.format(self.torrent_model.hash))
+
+        self.assertFalse(Torrent.objects.filter(pk=torrent_model.pk).exists())
+        self.assertListEqual(list(user.torrents.all()), [self.torrent_model])
+
+    @patch('torrents.tasks.get_free_space')
+    @patch('torrents.tasks.fetch_metainfo')
+    @patch('torrents.tasks.transmission.add_torrent')
+    def test_add_torrent_that_read_metainfo(self, mock_add_torrent, mock_fetch_metainfo, mock_get_free_space):
+        torrent_model = Torrent.objects.create(name='sample')
+        data = encode({'info': {'name': 'Sample', 'length': 1024, 'private': 1, 'piece length': 16384, 'pieces': ''}})
+        info_hash = hashlib.sha1(encode(decode(data)[b'info'])).hexdigest()
+        mock_fetch_metainfo.return_value = data
+        mock_get_free_space.return_value = 4096
+        mock_add_torrent.return_value = self.added_torrent(id=1, hashString=info_hash, name='Sample')
+
+        add_torrent(torrent_model.pk, 'http://www.publicdomaintorrents.com/sample.torrent')
+
+        mock_add_torrent.assert_called_once_with(base64.b64encode(data).decode())
+        torrent_model.refresh_from_db()
+        self.assertEqual(torrent_model.hash, info_hash)
+        self.assertEqual(torrent_model.size, 1024)
+        self.assertTrue(torrent_model.private)
+
+    @patch('torrents.tasks.get_free_space')
+    @patch('torrents.tasks.transmission.add_torrent')
+    def test_add_torrent_that_does_not_fit_free_space(self, mock_add_torrent, mock_get_free_space):
+        torrent_model = Torrent.objects.create(name='sample')
+        data = encode({'info': {'name': 'Sample', 'length': 8192, 'piece length': 16384, 'pieces': ''}})
+        mock_get_free_space.return_value = 4096
+
+        add_torrent(torrent_model.pk, metainfo=base64.b64encode(data).decode())
+
+        mock_add_torrent.assert_not_called()
+        self.assertFalse(Torrent.objects.filter(pk=torrent_model.pk).exists())
+
+    @patch('torrents.tasks.publish_events')
+    @patch('torrents.tasks.transmission.add_torrent')
+    def test_add_torrent_that_transmission_rejects(self, mock_add_torrent, mock_publish_events):
+        user = get_user_model().objects.create_user('johndoe', 'john@doe.com', 'johndoe')
+        torrent_model = Torrent.objects.create(name='sample', hash='fe8d8df9b015e44eccf5f58b210095ea9e0a046d')
+        user.torrents.add(torrent_model)
+        mock_add_torrent.side_effect = TransmissionError('Query failed with result "invalid or corrupt torrent".')
+
+        add_torrent(torrent_model.pk, 'magnet:?xt=urn:btih:{}'.format(torrent_model.hash))
+
+        self.assertFalse(Torrent.objects.filter(pk=torrent_model.pk).exists())
+        mock_publish_events.assert_called_once_with([([user.pk], 'torrent_error', {
+            'id': torrent_model.pk,
+            'name': 'sample',
+            'detail': "Torrent could not be added to transmission.",
+        })])
+
+    @patch('torrents.tasks.add_torrent.apply_async')
+    @patch('torrents.tasks.transmission.add_torrent')
+    def test_add_torrent_that_transmission_is_unavailable(self, mock_add_torrent, mock_apply_async):
+        torrent_model = Torrent.objects.create(name='sample')
+        link = 'magnet:?xt=urn:btih:fe8d8df9b015e44eccf5f58b210095ea9e0a046d'
+        mock_add_torrent.side_effect = TransmissionUnavailable('Transmission is unavailable.')
+
+        add_torrent(torrent_model.pk, link)
 
-        mock_get_torrent.assert_called_with(self.torrent_model.hash)
-        mock_hset.assert_called_with('torrent:{}'.format(self.torrent_model.pk), 'rate_upload', 0)
+        self.assertTrue(Torrent.objects.filter(pk=torrent_model.pk).exists())
+        mock_apply_async.assert_called_once_with((torrent_model.pk, link, None), countdown=RESET_TIMEOUT)
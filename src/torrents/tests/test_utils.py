@@ -0,0 +1,231 @@
+from unittest.mock import call, patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from transmissionrpc import HTTPHandlerError, TransmissionError
+
+from kuzgun.utils import redis
+
+from ..models import Torrent, TORRENT_HASH
+from .fake_transmission import linear, FakeTransmission
+from ..utils import (
+    get_info_hash, get_name, CircuitBreaker, KeepAliveHTTPHandler, LazyTransmissionRPC, TorrentMetrics,
+    TransmissionRPC, TransmissionUnavailable,
+)
+
+
+class TorrentUtilTests(TestCase):
+    """
+    Unit tests for torrent utils.
+    """
+    @patch('torrents.utils.redis.pipeline')
+    def test_torrent_metrics_flush(self, mock_pipeline):
+        metrics = TorrentMetrics(ttl=120)
+        metrics.set(1, rate_upload=10500, rate_download=105000)
+        metrics.set(2, rate_upload=0)
+        metrics.set(1, rate_download=0)
+
+        self.assertEqual(metrics.flush(), 2)
+        self.assertEqual(metrics.flush(), 0)
+
+        mock_pipeline.assert_called_once_with(transaction=False)
+        mock_pipeline.return_value.hmset.assert_has_calls([
+            call(TORRENT_HASH.format(1), {'rate_upload': 10500, 'rate_download': 0}),
+            call(TORRENT_HASH.format(2), {'rate_upload': 0}),
+        ], any_order=True)
+        mock_pipeline.return_value.expire.assert_has_calls([
+            call(TORRENT_HASH.format(1), 120),
+            call(TORRENT_HASH.format(2), 120),
+        ], any_order=True)
+        mock_pipeline.return_value.execute.assert_called_once_with()
+
+    @patch('torrents.utils.publish_events')
+    def test_torrent_metrics_flush_that_publish_changed_rates(self, mock_publish_events):
+        user = get_user_model().objects.create_user('johndoe', 'john@doe.com', 'johndoe')
+        torrent_models = [Torrent.objects.create(name='sample', hash=str(i) * 40) for i in range(3)]
+        user.torrents.add(*torrent_models)
+        self.addCleanup(redis.delete, *[TORRENT_HASH.format(torrent_model.pk) for torrent_model in torrent_models])
+
+        metrics = TorrentMetrics(ttl=120)
+        for torrent_model in torrent_models:
+            metrics.set(torrent_model.pk, rate_upload=100, rate_download=200, progress='10.00')
+        metrics.flush()
+
+        metrics.set(torrent_models[0].pk, rate_upload=100, rate_download=300, progress='20.00')
+        metrics.set(torrent_models[1].pk, rate_upload=100, rate_download=200, progress='20.00')
+        metrics.set(torrent_models[2].pk, rate_upload=0, rate_download=0)
+        # Rates of the published torrents are published along with their changes.
+        metrics.published.add(torrent_models[2].pk)
+        metrics.flush()
+
+        events, = mock_publish_events.call_args[0]
+        self.assertListEqual(
+            list(events), [([user.pk], 'torrent', {'id': torrent_models[0].pk, 'rate_download': 300})]
+        )
+        self.assertEqual(mock_publish_events.call_args[1], {'bump': False})
+
+    def test_get_info_hash(self):
+        info_hash = 'fe8d8df9b015e44eccf5f58b210095ea9e0a046d'
+
+        self.assertEqual(get_info_hash('magnet:?xt=urn:btih:{}&dn=sample'.format(info_hash.upper())), info_hash)
+        self.assertEqual(get_info_hash('magnet:?xt=urn:btih:72GY36NQCXSE5THV6WFSCAEV5KPAUBDN'), info_hash)
+        self.assertIsNone(get_info_hash('magnet:?xt=urn:btih:fe8d8df9&dn=sample'))
+        self.assertIsNone(get_info_hash('magnet:?dn=sample'))
+
+    def test_get_name(self):
+        magnet = 'magnet:?xt=urn:btih:72GY36NQCXSE5THV6WFSCAEV5KPAUBDN&dn=Sample+Video'
+
+        self.assertEqual(get_name(magnet), 'Sample Video')
+        self.assertEqual(get_name('http://example.com/download.php?file=Sample%20Video.torrent'), 'Sample Video')
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30)
+        redis.delete(breaker.failures_key, breaker.open_key, breaker.trial_key)
+        self.addCleanup(redis.delete, breaker.failures_key, breaker.open_key, breaker.trial_key)
+
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow_request())
+        self.assertLessEqual(redis.ttl(breaker.open_key), 30)
+
+        # Reset timeout passes, failed trial re-opens the circuit.
+        redis.delete(breaker.open_key)
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(redis.exists(breaker.trial_key))
+
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertFalse(redis.exists(breaker.failures_key))
+
+    def test_circuit_breaker_that_let_one_trial_through_when_half_open(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30, trial_timeout=15)
+        other = CircuitBreaker('test', failure_threshold=2, reset_timeout=30, trial_timeout=15)
+        redis.delete(breaker.failures_key, breaker.open_key, breaker.trial_key)
+        self.addCleanup(redis.delete, breaker.failures_key, breaker.open_key, breaker.trial_key)
+
+        breaker.record_failure()
+        breaker.record_failure()
+
+        # Reset timeout passes, only the first caller makes the trial call.
+        redis.delete(breaker.open_key)
+        self.assertTrue(breaker.allow_request())
+        self.assertLessEqual(redis.ttl(breaker.trial_key), 15)
+        self.assertFalse(other.allow_request())
+        self.assertFalse(breaker.allow_request())
+        self.assertTrue(other.is_open)
+
+        breaker.record_success()
+        self.assertTrue(other.allow_request())
+        self.assertTrue(other.allow_request())
+
+        # Trial caller never reports, the token expires and another caller makes the trial.
+        breaker.record_failure()
+        breaker.record_failure()
+        redis.delete(breaker.open_key)
+        self.assertTrue(breaker.allow_request())
+        redis.delete(breaker.trial_key)
+        self.assertTrue(other.allow_request())
+        self.assertFalse(breaker.allow_request())
+
+    @patch('torrents.utils.Client._request')
+    def test_transmission_rpc_that_report_trial_result(self, mock_request):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+        redis.delete(breaker.failures_key, breaker.open_key, breaker.trial_key)
+        self.addCleanup(redis.delete, breaker.failures_key, breaker.open_key, breaker.trial_key)
+        client = TransmissionRPC.__new__(TransmissionRPC)
+        client.breaker = breaker
+
+        mock_request.side_effect = TransmissionError('Request failed.', HTTPHandlerError(httpcode=502))
+        with self.assertRaises(TransmissionUnavailable):
+            client._request('torrent-get')
+
+        with self.assertRaises(TransmissionUnavailable):
+            client._request('torrent-get')
+
+        self.assertEqual(mock_request.call_count, 1)
+
+        # RPC error of the trial call means transmission is up.
+        redis.delete(breaker.open_key)
+        mock_request.side_effect = TransmissionError('Invalid torrent.')
+        with self.assertRaises(TransmissionError):
+            client._request('torrent-add')
+
+        self.assertFalse(breaker.is_open)
+        self.assertFalse(redis.exists(breaker.failures_key))
+
+    @patch('torrents.utils.os.getpid')
+    def test_circuit_breaker_that_is_shared_by_processes(self, mock_getpid):
+        worker = LazyTransmissionRPC('transmission', port=9091)
+        keys = worker.breaker.failures_key, worker.breaker.open_key, worker.breaker.trial_key
+        redis.delete(*keys)
+        self.addCleanup(redis.delete, *keys)
+
+        mock_getpid.return_value = 100
+        for _ in range(worker.breaker.failure_threshold):
+            worker.breaker.record_failure()
+
+        self.assertTrue(worker.is_unavailable)
+
+        # Another process never made a request, but it fails fast too.
+        mock_getpid.return_value = 200
+        other = LazyTransmissionRPC('transmission', port=9091)
+
+        self.assertTrue(other.is_unavailable)
+
+        with self.assertRaises(TransmissionUnavailable):
+            other.get_torrents()
+
+        other.breaker.record_success()
+        self.assertFalse(worker.is_unavailable)
+
+    @patch('torrents.utils.TransmissionRPC')
+    def test_lazy_transmission_rpc(self, mock_transmission_rpc):
+        transmission = LazyTransmissionRPC('transmission', port=9091)
+
+        mock_transmission_rpc.assert_not_called()
+        self.assertFalse(transmission.is_unavailable)
+
+        transmission.get_torrents()
+        transmission.stop_torrent([1])
+
+        self.assertEqual(mock_transmission_rpc.call_count, 1)
+        mock_transmission_rpc.return_value.stop_torrent.assert_called_once_with([1])
+
+    @patch('http.client.HTTPConnection')
+    def test_keep_alive_http_handler_that_retry_dropped_connection(self, mock_connection):
+        mock_connection.return_value.request.side_effect = [ConnectionResetError(), None]
+        mock_connection.return_value.getresponse.return_value.status = 200
+        mock_connection.return_value.getresponse.return_value.read.return_value = b'{"result": "success"}'
+        handler = KeepAliveHTTPHandler()
+
+        response = handler.request('http://transmission:9091/transmission/rpc', '{}', {}, 5)
+
+        self.assertEqual(response, '{"result": "success"}')
+        self.assertEqual(mock_connection.call_count, 2)
+        mock_connection.return_value.request.assert_called_with(
+            'POST', '/transmission/rpc', b'{}', {'Content-Type': 'application/json'}
+        )
+
+    def test_transmission_rpc_with_fake_transmission(self):
+        with FakeTransmission() as fake:
+            hashes = fake.create_torrents(3, curve=linear(60))
+            transmission = LazyTransmissionRPC(fake.address, port=fake.port, user='admin', password='admin')
+
+            torrents = transmission.get_torrents(hashes)
+            self.assertListEqual([torrent.hashString for torrent in torrents], hashes)
+            self.assertEqual(torrents[0].status, 'downloading')
+
+            torrent = transmission.add_torrent('magnet:?xt=urn:btih:fe8d8df9b015e44eccf5f58b210095ea9e0a046d')
+            self.assertEqual(torrent.hashString, 'fe8d8df9b015e44eccf5f58b210095ea9e0a046d')
+
+            transmission.stop_torrent([torrent.id])
+            self.assertEqual(transmission.get_torrent(torrent.hashString).status, 'stopped')
+
+            # Session handshake, then one request per call on the kept connection.
+            self.assertEqual(fake.request_count, 7)
@@ -1,12 +1,24 @@
-from collections import namedtuple
+import base64
+from hashlib import sha1
 from unittest.mock import patch
+from uuid import uuid4
 
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from files.enums import Volume
+from files.models import File
+from kuzgun.mixins import get_response_cache_stats
+from ..bencode import encode
 from ..models import Torrent
+from ..tasks import publish_torrent_events, COUNTDOWN
+from ..utils import TorrentMetrics
 
 
 class TorrentViewSetTests(APITestCase):
@@ -22,24 +34,209 @@ class TorrentViewSetTests(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsNotNone(response.data.get('count'))
+        self.assertNotIn('count', response.data)
+        self.assertIn('next', response.data)
         self.assertIsNotNone(response.data.get('results'))
 
-    @patch('torrents.views.transmission.add_torrent')
+    def test_list_torrents_that_paginate_by_cursor(self):
+        self._create_torrents(3, 0)
+        url = reverse('torrents:torrent-list')
+
+        response = self.client.get(url, {'limit': 2, 'count': 'true'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+
+        next_response = self.client.get(response.data['next'])
+        self.assertEqual(len(next_response.data['results']), 1)
+        self.assertLess(next_response.data['results'][0]['id'], response.data['results'][-1]['id'])
+        self.assertIsNone(next_response.data['next'])
+
+    def _create_torrents(self, count, file_count):
+        for i in range(count):
+            torrent_model = Torrent.objects.create(name='sample', hash=sha1(uuid4().bytes).hexdigest())
+            self.user.torrents.add(torrent_model)
+            torrent_model.files.add(*[
+                File.objects.create(volume=Volume.DATA, path='{}/{}.mp4'.format(torrent_model.hash, j))
+                for j in range(file_count)
+            ])
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        return len(context.captured_queries)
+
+    # TestCase never commits, so the version stamps are bumped right away.
+    @patch('kuzgun.utils.transaction.on_commit', side_effect=lambda func: func())
+    def test_list_torrents_that_query_count_is_fixed(self, mock_on_commit):
+        url = '{}?expand=files'.format(reverse('torrents:torrent-list'))
+        self._create_torrents(2, 1)
+        query_count = self._count_queries(url)
+
+        self._create_torrents(10, 5)
+        self.assertEqual(self._count_queries(url), query_count)
+
+    @patch('torrents.serializers.redis')
+    def test_list_torrents_that_serialize_requested_fields(self, mock_redis):
+        self._create_torrents(2, 2)
+        url = reverse('torrents:torrent-list')
+
+        response = self.client.get(url, {'fields': 'id,name,progress'})
+        self.assertSetEqual(set(response.data['results'][0]), {'id', 'name', 'progress'})
+        mock_redis.pipeline.assert_not_called()
+
+        response = self.client.get(url, {'fields': 'id,name', 'expand': 'files'})
+        self.assertSetEqual(set(response.data['results'][0]), {'id', 'name', 'files'})
+        self.assertEqual(len(response.data['results'][0]['files']), 2)
+
+        response = self.client.get(url)
+        self.assertNotIn('files', response.data['results'][0])
+        self.assertIn('rate_upload', response.data['results'][0])
+
+    # TestCase never commits, so the version stamps are bumped right away.
+    @patch('kuzgun.utils.transaction.on_commit', side_effect=lambda func: func())
+    @patch('kuzgun.mixins.time.time', return_value=1000.0)
+    def test_list_torrents_that_answer_not_modified(self, mock_time, mock_on_commit):
+        self._create_torrents(2, 1)
+        url = reverse('torrents:torrent-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+        self.assertFalse([query for query in context.captured_queries if 'torrents_torrent' in query['sql']])
+
+        # Linking a torrent bumps the version stamp of the user.
+        self._create_torrents(1, 0)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data['results']), 3)
+
+    @patch('kuzgun.mixins.time.time')
+    def test_list_torrents_that_change_etag_every_countdown(self, mock_time):
+        self._create_torrents(1, 0)
+        url = reverse('torrents:torrent-list')
+        mock_time.return_value = COUNTDOWN * 200
+        etag = self.client.get(url)['ETag']
+
+        self.assertTrue(etag.startswith('W/'))
+
+        # Weak comparison matches the strong form of the ETag too.
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag[2:])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Rates are polled every COUNTDOWN seconds without bumping the version stamp.
+        mock_time.return_value += COUNTDOWN
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotEqual(response['ETag'], etag)
+
+    @patch('kuzgun.mixins.time.time', return_value=1000.0)
+    def test_list_torrents_that_cache_responses(self, mock_time):
+        self._create_torrents(2, 1)
+        url = reverse('torrents:torrent-list')
+        stats = get_response_cache_stats()
+        response = self.client.get(url)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        with CaptureQueriesContext(connection) as context:
+            cached_response = self.client.get(url)
+
+        self.assertEqual(cached_response['X-Cache'], 'HIT')
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response['ETag'], response['ETag'])
+        self.assertFalse([query for query in context.captured_queries if 'torrents_torrent' in query['sql']])
+        self.assertEqual(get_response_cache_stats()['hits'], stats['hits'] + 1)
+
+        # Publishing changes of a saved torrent invalidates the cached responses.
+        torrent_model = self.user.torrents.first()
+        torrent_model.name = 'renamed'
+        torrent_model.save()
+        publish_torrent_events([torrent_model], TorrentMetrics(ttl=COUNTDOWN))
+        response = self.client.get(url)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('renamed', [item['name'] for item in response.data['results']])
+
+    @patch('torrents.views.add_torrent.delay')
     def test_create_torrent(self, mock_add_torrent):
         url = reverse('torrents:api-root')
         link = "http://www.publicdomaintorrents.com/bt/btdownload.php?type=torrent&file=Telephone_Operator.avi.torrent"
 
-        torrent = namedtuple('torrent', ['hashString', 'name', 'isPrivate'])
-        mock_add_torrent.return_value = torrent(
-            hashString='fe8d8df9b015e44eccf5f58b210095ea9e0a046d',
-            name='Telephone_Operator.avi',
-            isPrivate=False
-        )
+        response = self.client.post(url, {'link': link})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['name'], 'Telephone_Operator.avi')
+        self.assertIsNone(response.data['hash'])
+        mock_add_torrent.assert_called_once_with(response.data['id'], link, None)
+        self.assertTrue(self.user.torrents.filter(pk=response.data['id']).exists())
+
+    @patch('torrents.views.add_torrent.delay')
+    def test_create_torrent_that_magnet_exists(self, mock_add_torrent):
+        torrent_model = Torrent.objects.create(hash='fe8d8df9b015e44eccf5f58b210095ea9e0a046d', name='sample.avi')
+        url = reverse('torrents:api-root')
+        link = 'magnet:?xt=urn:btih:FE8D8DF9B015E44ECCF5F58B210095EA9E0A046D&dn=sample.avi'
 
         response = self.client.post(url, {'link': link})
 
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], torrent_model.pk)
+        mock_add_torrent.assert_not_called()
+        self.assertTrue(self.user.torrents.filter(pk=torrent_model.pk).exists())
+
+    @patch('torrents.views.add_torrent.delay')
+    def test_create_torrent_that_magnet_does_not_exist(self, mock_add_torrent):
+        url = reverse('torrents:api-root')
+        link = 'magnet:?xt=urn:btih:7ZGY36ORTFSKZLY4NCZ7BWX5MLOYPXYZ&dn=sample.avi'
+
+        response = self.client.post(url, {'link': link})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['name'], 'sample.avi')
+        self.assertEqual(response.data['hash'], 'fe4d8df9d19964acaf1c68b3f0dafd62dd87df19')
+        mock_add_torrent.assert_called_once_with(response.data['id'], link, None)
+
+        # Pending torrent is linked again before it's added to transmission.
+        response = self.client.post(url, {'link': link})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Torrent.objects.filter(hash='fe4d8df9d19964acaf1c68b3f0dafd62dd87df19').count(), 1)
+        mock_add_torrent.assert_called_once_with(response.data['id'], link, None)
+
+    def test_create_torrent_that_magnet_is_invalid(self):
+        url = reverse('torrents:api-root')
+        response = self.client.post(url, {'link': 'magnet:?dn=sample.avi'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch('torrents.views.add_torrent.delay')
+    def test_create_torrent_that_upload_file(self, mock_add_torrent):
+        url = reverse('torrents:api-root')
+        data = encode({'info': {'name': 'Sample', 'length': 1024, 'piece length': 16384, 'pieces': ''}})
+
+        response = self.client.post(url, {'file': SimpleUploadedFile('sample.torrent', data)})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['name'], 'Sample')
+        self.assertEqual(response.data['size'], 1024)
+        mock_add_torrent.assert_called_once_with(response.data['id'], None, base64.b64encode(data).decode())
+
+    def test_create_torrent_that_upload_invalid_file(self):
+        url = reverse('torrents:api-root')
+        response = self.client.post(url, {'file': SimpleUploadedFile('sample.torrent', b'<html></html>')})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_create_torrent_that_return_bad_request(self):
         url = reverse('torrents:api-root')
@@ -49,6 +246,39 @@ class TorrentViewSetTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @patch('torrents.views.add_torrents.delay')
+    def test_bulk_create_torrents(self, mock_add_torrents):
+        torrent_model = Torrent.objects.create(hash='fe8d8df9b015e44eccf5f58b210095ea9e0a046d', name='sample.avi')
+        url = reverse('torrents:torrent-bulk-list')
+        links = [
+            'magnet:?xt=urn:btih:fe8d8df9b015e44eccf5f58b210095ea9e0a046d',
+            'magnet:?xt=urn:btih:7ZGY36ORTFSKZLY4NCZ7BWX5MLOYPXYZ&dn=sample',
+            'magnet:?xt=urn:btih:fe4d8df9d19964acaf1c68b3f0dafd62dd87df19&dn=sample',
+            'http://www.publicdomaintorrents.com/Telephone_Operator.avi.torrent',
+            'http://www.publicdomaintorrents.com/Telephone_Operator.avi',
+        ]
+
+        response = self.client.post(url, {'links': links}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([result['status'] for result in response.data], [200, 202, 202, 202, 400])
+        self.assertEqual(response.data[0]['id'], torrent_model.pk)
+        self.assertEqual(response.data[1]['id'], response.data[2]['id'])
+        self.assertEqual(
+            Torrent.objects.get(pk=response.data[1]['id']).hash, 'fe4d8df9d19964acaf1c68b3f0dafd62dd87df19'
+        )
+        self.assertEqual(self.user.torrents.count(), 3)
+        self.assertListEqual(
+            sorted(mock_add_torrents.call_args[0][0]),
+            sorted([[response.data[1]['id'], links[1]], [response.data[3]['id'], links[3]]])
+        )
+
+    def test_bulk_create_torrents_that_return_bad_request(self):
+        url = reverse('torrents:torrent-bulk-list')
+        response = self.client.post(url, {'links': []}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_destroy_torrent(self):
         torrent_model = Torrent.objects.create(hash='63b024bf50a50ca95f1b2364a946faf8', name='sample.avi')
         self.user.torrents.add(torrent_model)
@@ -60,3 +290,26 @@ class TorrentViewSetTests(APITestCase):
 
         with self.assertRaises(Torrent.DoesNotExist):
             self.user.torrents.get(pk=torrent_model.pk)
+
+    @override_settings(TORRENT_DONE_TOKEN='secret')
+    @patch('torrents.views.delay_update_and_save_information')
+    def test_done_torrent(self, mock_delay_update_and_save_information):
+        torrent_model = Torrent.objects.create(hash='63b024bf50a50ca95f1b2364a946faf8', name='sample.avi')
+
+        self.client.logout()
+        url = reverse('torrents:torrent-done-list')
+        response = self.client.post(url, {'hash': torrent_model.hash}, HTTP_X_TORRENT_DONE_TOKEN='secret')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        mock_delay_update_and_save_information.assert_called_with(torrent_model.pk)
+
+    @override_settings(TORRENT_DONE_TOKEN='secret')
+    @patch('torrents.views.delay_update_and_save_information')
+    def test_done_torrent_that_return_forbidden(self, mock_delay_update_and_save_information):
+        url = reverse('torrents:torrent-done-list')
+        response = self.client.post(
+            url, {'hash': '63b024bf50a50ca95f1b2364a946faf8'}, HTTP_X_TORRENT_DONE_TOKEN='guess'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        mock_delay_update_and_save_information.assert_not_called()
@@ -1,12 +1,463 @@
-from transmissionrpc import Client
+import base64
+import binascii
+import http.client
+import os
+import re
+import shutil
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qs, unquote, urlparse
+from urllib.request import urlopen
+
+from django.contrib.auth import get_user_model
+from transmissionrpc import Client, HTTPHandlerError, TransmissionError
+from transmissionrpc.httphandler import HTTPHandler
+
+from kuzgun.utils import publish_events, redis
+from files.enums import Volume
+from .models import TORRENT_HASH
+
+# Torrent fields requested from transmission by each call site.
+# Transmission torrent objects can't be created without `id`.
+POLL_FIELDS = (
+    'id', 'hashString', 'status', 'sizeWhenDone', 'leftUntilDone', 'uploadRatio', 'rateUpload', 'rateDownload', 'eta',
+)
+FINISH_FIELDS = POLL_FIELDS + ('name', 'isPrivate', 'files', 'priorities', 'wanted')
+SEED_FIELDS = ('id', 'hashString', 'status', 'uploadRatio', 'rateUpload')
+
+# Metrics which are published as `torrent` events whenever they change.
+RATE_FIELDS = ('rate_upload', 'rate_download')
+
+# Transmission stops seeding the torrent once it reaches this ratio.
+SEED_RATIO_LIMIT = 2
+
+FETCH_TIMEOUT = 10  # seconds
+MAX_METAINFO_SIZE = 10 * 1024 * 1024  # bytes
+
+RPC_TIMEOUT = 5  # seconds
+RPC_RETRIES = 2  # retries of the requests on a dropped connection
+FAILURE_THRESHOLD = 5  # consecutive failures which open the circuit
+RESET_TIMEOUT = 30  # seconds the circuit stays open
+BREAKER_FAILURES = '{}:breaker:failures'
+BREAKER_OPEN = '{}:breaker:open'
+BREAKER_TRIAL = '{}:breaker:trial'
+TRIAL_TIMEOUT = RPC_TIMEOUT * (RPC_RETRIES + 1)  # seconds a trial call holds the half-open circuit
+
+
+class TransmissionUnavailable(TransmissionError):
+    """
+    Raised when transmission can't be reached or the circuit is open.
+    """
+
+
+class KeepAliveHTTPHandler(HTTPHandler):
+    """
+    HTTP handler of transmissionrpc which keeps one connection per thread open.
+    Requests are retried up to RPC_RETRIES times if the kept connection is dropped.
+    """
+    def __init__(self):
+        super(KeepAliveHTTPHandler, self).__init__()
+        self.local = threading.local()
+        self.headers = {'Content-Type': 'application/json'}
+
+    def set_authentication(self, uri, login, password):
+        credentials = base64.b64encode('{}:{}'.format(login, password).encode()).decode()
+        self.headers['Authorization'] = 'Basic {}'.format(credentials)
+
+    def get_connection(self, url, timeout):
+        """
+        Get the connection of current thread to the url.
+
+        :param url: Transmission RPC url
+        :param timeout: seconds
+        :return: HTTPConnection
+        """
+        connection = getattr(self.local, 'connection', None)
+
+        if connection is None:
+            url = urlparse(url)
+            connection = self.local.connection = http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+
+        connection.timeout = timeout
+
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+        return connection
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def request(self, url, query, headers, timeout):
+        headers = dict(self.headers, **headers)
+
+        for retry in range(RPC_RETRIES + 1):
+            connection = self.get_connection(url, timeout)
+
+            try:
+                connection.request('POST', urlparse(url).path, query.encode(), headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (ConnectionResetError, BrokenPipeError, http.client.RemoteDisconnected) as e:
+                self.close()
+
+                if retry == RPC_RETRIES:
+                    raise HTTPHandlerError(url, None, str(e))
+            except (OSError, http.client.HTTPException) as e:  # Timeouts and refused connections aren't retried.
+                self.close()
+                raise HTTPHandlerError(url, None, str(e))
+
+        if response.status != 200:
+            raise HTTPHandlerError(url, response.status, response.reason, dict(response.getheaders()), data)
+
+        return data.decode('utf-8')
+
+
+class CircuitBreaker(object):
+    """
+    Opens after FAILURE_THRESHOLD consecutive failures and rejects calls for
+    RESET_TIMEOUT seconds. Then the circuit is half-open: a single trial call
+    is let through and the others are still rejected until it reports. The
+    circuit closes if the trial succeeds and opens again if it fails. State is
+    kept in redis, so every web and celery process shares the same circuit.
+    """
+    def __init__(self, name='transmission', failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 trial_timeout=TRIAL_TIMEOUT):
+        self.failures_key = BREAKER_FAILURES.format(name)
+        self.open_key = BREAKER_OPEN.format(name)
+        self.trial_key = BREAKER_TRIAL.format(name)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trial_timeout = trial_timeout
+
+    @property
+    def is_open(self):
+        """
+        Whether calls are rejected, i.e. the circuit is open or its trial call is in progress.
+
+        :return: bool
+        """
+        return any(redis.mget(self.open_key, self.trial_key))
+
+    def allow_request(self):
+        """
+        Whether the call can be made. Only the caller which takes the trial
+        token passes the half-open circuit. The token expires after
+        trial_timeout seconds in case its caller never reports.
+
+        :return: bool
+        """
+        is_open, failures = redis.mget(self.open_key, self.failures_key)
+
+        if is_open:
+            return False
+
+        if int(failures or 0) < self.failure_threshold:
+            return True
+
+        return bool(redis.set(self.trial_key, 1, nx=True, ex=self.trial_timeout))
+
+    def record_success(self):
+        redis.delete(self.failures_key, self.open_key, self.trial_key)
+
+    def record_failure(self):
+        pipeline = redis.pipeline()
+        pipeline.incr(self.failures_key)
+        # Failures outlive the open circuit, so a failed trial after it re-opens the circuit.
+        pipeline.expire(self.failures_key, self.reset_timeout * 2)
+        failures, _ = pipeline.execute()
+
+        if failures >= self.failure_threshold:
+            pipeline = redis.pipeline()
+            pipeline.set(self.open_key, 1, ex=self.reset_timeout)
+            pipeline.delete(self.trial_key)
+            pipeline.execute()
 
 
 class TransmissionRPC(Client):
     """
     TransmissionRPC class that extends Client.
+    Requests POLL_FIELDS instead of every torrent field unless arguments are given.
+    Fails fast with TransmissionUnavailable while the circuit breaker is open.
     """
+    def __init__(self, *args, breaker=None, **kwargs):
+        self.breaker = breaker or CircuitBreaker()
+        super(TransmissionRPC, self).__init__(*args, **kwargs)
+
+    def _request(self, *args, **kwargs):
+        if not self.breaker.allow_request():
+            raise TransmissionUnavailable('Transmission is unavailable, circuit is open.')
+
+        try:
+            result = super(TransmissionRPC, self)._request(*args, **kwargs)
+        except TransmissionError as e:
+            error = e.original
+
+            # RPC errors (e.g. invalid or duplicate torrent) mean transmission is up.
+            if isinstance(error, HTTPHandlerError) and (error.code is None or error.code >= 500):
+                self.breaker.record_failure()
+                raise TransmissionUnavailable('Transmission is unavailable.', error)
+
+            self.breaker.record_success()
+            raise
+
+        self.breaker.record_success()
+
+        return result
+
     def add_torrent(self, torrent, timeout=None, **kwargs):
-        return self.get_torrent(super(TransmissionRPC, self).add_torrent(torrent, timeout, **kwargs).id)
+        """
+        Adds the torrent and sets its seed ratio limit to SEED_RATIO_LIMIT.
+        Returned torrent object has only `id`, `hashString` and `name` fields.
+        """
+        torrent = super(TransmissionRPC, self).add_torrent(torrent, timeout, **kwargs)
+        self.change_torrent(torrent.id, timeout, seedRatioLimit=SEED_RATIO_LIMIT, seedRatioMode=1)
+
+        return torrent
+
+    def get_torrent(self, torrent_id, arguments=POLL_FIELDS, timeout=None):
+        return super(TransmissionRPC, self).get_torrent(torrent_id, arguments=arguments, timeout=timeout)
+
+    def get_torrents(self, ids=None, arguments=POLL_FIELDS, timeout=None):
+        return super(TransmissionRPC, self).get_torrents(ids=ids, arguments=arguments, timeout=timeout)
+
+
+def get_info_hash(link):
+    """
+    Get info hash of the magnet link as a lowercase hex string.
+    Base32 encoded hashes are converted to hex.
+
+    :param link: Magnet link
+    :return: str or None if the link has no valid btih.
+    """
+    for xt in parse_qs(urlparse(link).query).get('xt', []):
+        if not xt.lower().startswith('urn:btih:'):
+            continue
+
+        info_hash = xt[len('urn:btih:'):]
+
+        if re.match(r'^[0-9a-fA-F]{40}$', info_hash):
+            return info_hash.lower()
+
+        if len(info_hash) == 32:
+            try:
+                return binascii.hexlify(base64.b32decode(info_hash.upper())).decode()
+            except binascii.Error:
+                pass
+
+    return None
+
+
+def get_name(link):
+    """
+    Get display name of the magnet/torrent link to show until transmission names the torrent.
+
+    :param link: Magnet or torrent link
+    :return: str
+    """
+    if link.startswith('magnet:'):
+        names = parse_qs(urlparse(link).query).get('dn')
+        name = names and names[0] or get_info_hash(link) or ''
+    else:
+        name = unquote(re.split('[/=]', link)[-1])
+
+        if name.endswith('.torrent'):
+            name = name[:-len('.torrent')]
+
+    return name[:150]
+
+
+def fetch_metainfo(link):
+    """
+    Downloads the .torrent file of the link.
+
+    :param link: Torrent link
+    :return: bytes
+    :raises: ValueError if the file is larger than MAX_METAINFO_SIZE.
+    :raises: OSError if the file can't be downloaded (URLError, timeout).
+    """
+    with urlopen(link, timeout=FETCH_TIMEOUT) as response:
+        data = response.read(MAX_METAINFO_SIZE + 1)
+
+    if len(data) > MAX_METAINFO_SIZE:
+        raise ValueError('Torrent file is larger than {} bytes.'.format(MAX_METAINFO_SIZE))
+
+    return data
+
+
+def get_free_space():
+    """
+    Get free space of the torrent volume.
+
+    :return: int: bytes or None if the volume is not mounted.
+    """
+    try:
+        return shutil.disk_usage('/{}'.format(Volume.TORRENT.value)).free
+    except FileNotFoundError:
+        return None
+
+
+def get_user_ids(torrent_ids):
+    """
+    Get PKs of the users of the torrents with a single query.
+
+    :param torrent_ids: iterable of Torrent PKs
+    :return: dict: list of user PKs by Torrent PK.
+    """
+    user_ids = defaultdict(list)
+    links = get_user_model().torrents.through.objects.filter(
+        torrent_id__in=list(torrent_ids)
+    ).values_list('torrent_id', 'myuser_id')
+
+    for torrent_id, user_id in links:
+        user_ids[torrent_id].append(user_id)
+
+    return user_ids
+
+
+class TorrentMetrics(object):
+    """
+    Collects live metrics (rates, progress) of the torrents and writes
+    them to their TORRENT_HASH hashes in redis with a single pipeline.
+    Hashes expire after ttl seconds unless they are written again.
+
+    Rates which change are published to the users of the torrents on flush,
+    since they change without any change of the Torrent objects. Torrents which
+    are already published along with their metrics are marked as `published`.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.updates = {}
+        self.published = set()
+
+    def set(self, torrent_id, **values):
+        """
+        Sets metrics of the torrent to be written on flush.
+
+        :param torrent_id: PK of Torrent object
+        :param values: metric names and values
+        :return: None
+        """
+        self.updates.setdefault(torrent_id, {}).update(values)
+
+    def flush(self):
+        """
+        Writes collected metrics to redis in one round trip, reading the previous
+        rates in the same round trip. Changed rates of the torrents which aren't
+        published yet are published as `torrent` events.
+
+        :return: int: number of written torrents.
+        """
+        if not self.updates:
+            return 0
+
+        pipe = redis.pipeline(transaction=False)
+        torrent_ids = list(self.updates)
+
+        for torrent_id in torrent_ids:
+            pipe.hmget(TORRENT_HASH.format(torrent_id), RATE_FIELDS)
+            pipe.hmset(TORRENT_HASH.format(torrent_id), self.updates[torrent_id])
+            pipe.expire(TORRENT_HASH.format(torrent_id), self.ttl)
+
+        results = pipe.execute()
+        changes = {}
+
+        for torrent_id, previous in zip(torrent_ids, results[::3]):
+            values, previous = self.updates[torrent_id], dict(zip(RATE_FIELDS, previous))
+            rates = {
+                name: values[name] for name in RATE_FIELDS
+                if name in values and str(values[name]) != (previous[name] or '0')
+            }
+
+            if rates and torrent_id not in self.published:
+                changes[torrent_id] = rates
+
+        if changes:
+            self.publish_rates(changes)
+
+        count, self.updates, self.published = len(self.updates), {}, set()
+
+        return count
+
+    def publish_rates(self, changes):
+        """
+        Publishes changed rates to the users of the torrents as `torrent` events.
+        Version stamps of the users aren't bumped, since rates aren't stored in the database.
+
+        :param changes: dict: changed rates by Torrent PK.
+        :return: None
+        """
+        user_ids = get_user_ids(changes)
+
+        publish_events((
+            (user_ids[torrent_id], 'torrent', dict(rates, id=torrent_id))
+            for torrent_id, rates in changes.items() if user_ids[torrent_id]
+        ), bump=False)
+
+
+class LazyTransmissionRPC(object):
+    """
+    Creates the TransmissionRPC client on first use in each process, since its
+    constructor requests the session and connections can't be shared after fork.
+    Only the methods used by the app are proxied.
+    """
+    def __init__(self, address, **kwargs):
+        self.address = address
+        self.kwargs = kwargs
+        self.lock = threading.Lock()
+        self.pid = None
+        self.client = None
+        self.breaker = CircuitBreaker()
+
+    def get_client(self):
+        """
+        Get the client of current process.
+
+        :return: TransmissionRPC
+        :raises: TransmissionUnavailable
+        """
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.client, self.pid = None, os.getpid()
+
+        if self.client is None:
+            with self.lock:
+                if self.client is None:
+                    self.client = TransmissionRPC(
+                        self.address, http_handler=KeepAliveHTTPHandler(), breaker=self.breaker, **self.kwargs
+                    )
+
+        return self.client
+
+    @property
+    def is_unavailable(self):
+        """
+        Whether the circuit breaker is open in any process.
+
+        :return: bool
+        """
+        return self.breaker.is_open
+
+    def add_torrent(self, *args, **kwargs):
+        return self.get_client().add_torrent(*args, **kwargs)
+
+    def change_torrent(self, *args, **kwargs):
+        return self.get_client().change_torrent(*args, **kwargs)
+
+    def get_torrent(self, *args, **kwargs):
+        return self.get_client().get_torrent(*args, **kwargs)
+
+    def get_torrents(self, *args, **kwargs):
+        return self.get_client().get_torrents(*args, **kwargs)
+
+    def stop_torrent(self, *args, **kwargs):
+        return self.get_client().stop_torrent(*args, **kwargs)
 
 
-transmission = TransmissionRPC('transmission', user='admin', password='admin', port=9091)
+transmission = LazyTransmissionRPC('transmission', user='admin', password='admin', port=9091, timeout=RPC_TIMEOUT)
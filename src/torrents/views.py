@@ -1,64 +1,204 @@
+import base64
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404
+from django.utils.crypto import constant_time_compare
 from rest_framework import status
+from rest_framework.decorators import list_route
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, ListModelMixin, DestroyModelMixin
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from kuzgun.mixins import CachedResponseMixin
+from kuzgun.pagination import IdCursorPagination
+from kuzgun.serializers import get_query_list
+from .bencode import parse_metainfo, BencodeError
 from .models import Torrent
 from .serializers import TorrentSerializer
-from .utils import transmission
+from .tasks import add_torrent, add_torrents, delay_update_and_save_information, COUNTDOWN
+from .utils import get_info_hash, get_name, MAX_METAINFO_SIZE
+
+BULK_MAX_LINKS = 500
 
 
-class TorrentViewSet(CreateModelMixin, RetrieveModelMixin, ListModelMixin, DestroyModelMixin, GenericViewSet):
+class TorrentViewSet(CachedResponseMixin, CreateModelMixin, RetrieveModelMixin, ListModelMixin, DestroyModelMixin,
+                     GenericViewSet):
     """
     Torrent API endpoint for Torrent model (/torrents).
     Supported methods: Create, Retrieve, List, Destroy
     """
     queryset = Torrent.objects.all()
     serializer_class = TorrentSerializer
+    pagination_class = IdCursorPagination
+    cache_timeout = COUNTDOWN * 2  # Rates change without bumping the version stamp.
+    version_bucket = COUNTDOWN
 
     def get_queryset(self):
         """
         Gets torrents queryset of the user.
+        Files are prefetched if they are expanded, so a page costs one files query.
 
         :return: QuerySet
         """
-        return self.request.user.torrents.all()
+        queryset = self.request.user.torrents.all()
+
+        if self.action in ('list', 'retrieve') and 'files' in get_query_list(self.request, 'expand'):
+            queryset = queryset.prefetch_related('files')
+
+        return queryset
 
     def create(self, request, *args, **kwargs):
         """
-        Creates a Torrent object links it to the user.
-        Validates `url` query parameter whether is a magnet/torrent link or not.
+        Links the Torrent object of the magnet/torrent link or the uploaded
+        .torrent `file` to the user. Validates `link` parameter whether is
+        a magnet/torrent link or not.
+
+        Torrents which already exist are linked right away (200) if their info
+        hash is known locally (magnet links and uploaded files). Otherwise
+        a pending Torrent object is created with the known info hash and the
+        torrent is added to transmission by the add_torrent task (202).
 
         :return: Response
         """
         link = request.data.get('link', '').strip()
-        url_validator = URLValidator()
+        upload = request.FILES.get('file')
+        defaults, metainfo = {'name': get_name(link)}, None
 
         try:
-            if not link.startswith('magnet:'):
-                url_validator(link)
-                if not link.endswith('.torrent'):
-                    raise ValidationError("Invalid torrent URL.")
+            if upload is not None:
+                if upload.size > MAX_METAINFO_SIZE:
+                    raise ValidationError("Torrent file is too large.")
+                data = upload.read()
+                info = parse_metainfo(data)
+                info_hash, metainfo = info.info_hash, base64.b64encode(data).decode()
+                defaults = {'name': info.name[:150], 'size': info.size, 'private': info.private}
+            else:
+                info_hash = self.validate_link(link)
+        except BencodeError:
+            return Response({'detail': "Invalid torrent file."}, status=status.HTTP_400_BAD_REQUEST)
         except ValidationError as e:
             return Response({'detail': e}, status=status.HTTP_400_BAD_REQUEST)
 
-        torrent = transmission.add_torrent(link)
-        torrent_model, created = Torrent.objects.get_or_create(
-            hash=torrent.hashString,
-            defaults={
-                'name': torrent.name,
-                'private': torrent.isPrivate,
-            },
-        )
+        if info_hash:
+            # Same torrent submitted concurrently is deduplicated by the unique hash.
+            torrent_model, created = Torrent.objects.get_or_create(hash=info_hash, defaults=defaults)
+        else:
+            torrent_model, created = Torrent.objects.create(**defaults), True
 
         request.user.torrents.add(torrent_model)
 
-        return Response(
-            self.serializer_class(torrent_model).data,
-            status=created and status.HTTP_201_CREATED or status.HTTP_200_OK
-        )
+        if not created:
+            return Response(self.get_serializer(torrent_model).data, status=status.HTTP_200_OK)
+
+        add_torrent.delay(torrent_model.pk, link or None, metainfo)
+
+        return Response(self.get_serializer(torrent_model).data, status=status.HTTP_202_ACCEPTED)
+
+    @list_route(['post'])
+    def bulk(self, request):
+        """
+        Links the Torrent objects of the magnet/torrent `links` to the user at once.
+        Links are validated together and de-duplicated by their info hash. Existing
+        torrents are linked right away, the others are created as pending Torrent
+        objects (with the info hash of magnet links) and added to transmission by
+        one add_torrents task.
+
+        Returns a result for each link: `status` is 200 (linked), 202 (pending)
+        or 400 (invalid, with `detail`).
+
+        :return: Response
+        """
+        links = request.data.get('links')
+
+        if not isinstance(links, list) or not links:
+            return Response({'detail': "`links` must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(links) > BULK_MAX_LINKS:
+            return Response(
+                {'detail': "At most {} links can be submitted at once.".format(BULK_MAX_LINKS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results, keys = [], {}
+
+        for link in links:
+            link = isinstance(link, str) and link.strip() or ''
+
+            try:
+                info_hash = self.validate_link(link)
+            except ValidationError as e:
+                results.append({'link': link, 'status': status.HTTP_400_BAD_REQUEST, 'detail': e.messages[0]})
+                continue
+
+            # Magnet links are de-duplicated by their info hash, torrent links by themselves.
+            keys.setdefault(info_hash or link, link)
+            results.append({'link': link, 'key': info_hash or link})
+
+        existing = {
+            torrent_model.hash: torrent_model
+            for torrent_model in Torrent.objects.filter(hash__in=[key for key, link in keys.items() if key != link])
+        }
+        pending = {
+            key: Torrent(name=get_name(link), hash=key != link and key or None)
+            for key, link in keys.items() if key not in existing
+        }
+
+        try:
+            with transaction.atomic():
+                Torrent.objects.bulk_create(pending.values())
+        except IntegrityError:
+            # Some of the magnet links are submitted concurrently, create them one by one.
+            for key, torrent_model in list(pending.items()):
+                if torrent_model.hash is None:
+                    torrent_model.save()
+                    continue
+
+                pending[key], created = Torrent.objects.get_or_create(
+                    hash=torrent_model.hash, defaults={'name': torrent_model.name}
+                )
+
+                if not created:
+                    existing[key] = pending.pop(key)
+
+        request.user.torrents.add(*existing.values(), *pending.values())
+
+        if pending:
+            add_torrents.delay([[torrent_model.pk, keys[key]] for key, torrent_model in pending.items()])
+
+        for result in results:
+            key = result.pop('key', None)
+
+            if key in existing:
+                result.update(status=status.HTTP_200_OK, id=existing[key].pk)
+            elif key in pending:
+                result.update(status=status.HTTP_202_ACCEPTED, id=pending[key].pk)
+
+        return Response(results, status=status.HTTP_200_OK)
+
+    def validate_link(self, link):
+        """
+        Validates the link whether is a magnet/torrent link or not.
+
+        :param link: Magnet or torrent link
+        :return: str: info hash of the magnet link or None for torrent links.
+        :raises: ValidationError
+        """
+        if link.startswith('magnet:'):
+            info_hash = get_info_hash(link)
+            if not info_hash:
+                raise ValidationError("Invalid magnet link.")
+
+            return info_hash
+
+        URLValidator()(link)
+        if not link.endswith('.torrent'):
+            raise ValidationError("Invalid torrent URL.")
+
+        return None
 
     def destroy(self, request, *args, **kwargs):
         """
@@ -70,3 +210,24 @@ class TorrentViewSet(CreateModelMixin, RetrieveModelMixin, ListModelMixin, Destr
         self.request.user.torrents.remove(torrent_model)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @list_route(['post'], authentication_classes=(), permission_classes=(AllowAny,))
+    def done(self, request):
+        """
+        Called by transmission's torrent done script with the `hash` of the torrent.
+        Finishes the torrent right away instead of waiting for the next poll.
+        Requires X-Torrent-Done-Token header to match TORRENT_DONE_TOKEN setting.
+
+        :return: Response
+        """
+        token = request.META.get('HTTP_X_TORRENT_DONE_TOKEN', '')
+
+        if not settings.TORRENT_DONE_TOKEN or not constant_time_compare(token, settings.TORRENT_DONE_TOKEN):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        torrent_model = get_object_or_404(Torrent, hash=request.data.get('hash', '').strip().lower())
+
+        if not torrent_model.finished:
+            delay_update_and_save_information(torrent_model.pk)
+
+        return Response(status=status.HTTP_202_ACCEPTED)
@@ -1,7 +1,162 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha1
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import ugettext_lazy as _
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from kuzgun.redis import redis
+
+TOKEN_USER = 'token:{}:user'
+TOKEN_CACHE_SIZE = 1024  # tokens per process
+TOKEN_CACHE_TIMEOUT = 10  # seconds
+TOKEN_REDIS_TIMEOUT = 300  # seconds
+
+# Password hash never leaves the database, it's deferred on cached users.
+EXCLUDED_FIELDS = ('password',)
+
+
+class LRUCache(object):
+    """
+    Thread-safe in-process LRU cache whose entries expire after timeout seconds.
+    """
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry[0] < time.time():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.timeout, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = LRUCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TIMEOUT)
+
+
+def get_cache_key(key):
+    """
+    Get redis key of the token. Token keys are stored hashed.
+
+    :param key: Token key
+    :return: str
+    """
+    return TOKEN_USER.format(sha1(key.encode()).hexdigest())
+
+
+def dump_user(user):
+    """
+    Get fields of the User object to cache.
+
+    :param user: User object
+    :return: dict
+    """
+    return {
+        field.attname: field.value_from_object(user)
+        for field in user._meta.concrete_fields if field.attname not in EXCLUDED_FIELDS
+    }
+
+
+def load_user(fields):
+    """
+    Get User object of the cached fields without any query.
+
+    :param fields: dict
+    :return: User object
+    """
+    model = get_user_model()
+    concrete_fields = [field for field in model._meta.concrete_fields if field.attname in fields]
+
+    return model.from_db(
+        DEFAULT_DB_ALIAS,
+        [field.attname for field in concrete_fields],
+        [field.to_python(fields[field.attname]) for field in concrete_fields],
+    )
+
+
+def invalidate_token(key):
+    """
+    Deletes the token from both of the caches.
+
+    :param key: Token key
+    :return: None
+    """
+    token_cache.delete(key)
+    redis.delete(get_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication which caches the users of the tokens in two levels:
+    an in-process LRU cache (TOKEN_CACHE_TIMEOUT) backed by redis (TOKEN_REDIS_TIMEOUT).
+    Authenticating a cached token doesn't query the database. Tokens are
+    invalidated by the signals when they are deleted or rotated, or their users change.
+
+    Signals clear the in-process cache of their own process only, so in-process
+    hits are checked against the redis entry, which every process shares.
+    """
+    def authenticate_credentials(self, key):
+        fields = token_cache.get(key)
+
+        if fields is not None and not redis.exists(get_cache_key(key)):
+            # Invalidated by another process.
+            token_cache.delete(key)
+            fields = None
+
+        if fields is None:
+            cached = redis.get(get_cache_key(key))
+
+            if cached is not None:
+                fields = json.loads(cached)
+            else:
+                user, token = super(CachedTokenAuthentication, self).authenticate_credentials(key)
+                fields = dump_user(user)
+                redis.set(get_cache_key(key), json.dumps(fields, cls=DjangoJSONEncoder), ex=TOKEN_REDIS_TIMEOUT)
+
+            token_cache.set(key, fields)
+
+        user = load_user(fields)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        return user, Token(key=key, user_id=user.pk)
 
 
-class QueryStringTokenAuthentication(TokenAuthentication):
+class QueryStringTokenAuthentication(CachedTokenAuthentication):
     """
     Query string based token authentication.
     This authentication class allows user able to
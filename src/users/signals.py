@@ -1,11 +1,13 @@
 import os
 
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
 from files.enums import Volume
+from kuzgun.utils import bump_user_versions, bump_user_versions_on_commit
+from .authentication import invalidate_token
 
 
 @receiver(post_save, sender=get_user_model())
@@ -17,6 +19,17 @@ def create_auth_token(**kwargs):
         Token.objects.create(user=kwargs['instance'])
 
 
+@receiver(post_save, sender=get_user_model())
+def bump_version(**kwargs):
+    """
+    Bumps version stamp of the new user, so it never starts from the stamp
+    of a deleted user with the same PK. It's bumped right away, since nothing
+    can be requested for the user before it's committed.
+    """
+    if kwargs['created']:
+        bump_user_versions([kwargs['instance'].pk])
+
+
 @receiver(post_save, sender=get_user_model())
 def create_upload_directory(**kwargs):
     """
@@ -28,3 +41,44 @@ def create_upload_directory(**kwargs):
 
         if not os.path.exists(directory):
             os.mkdir('/{}/{}'.format(Volume.UPLOAD.value, kwargs['instance'].username))
+
+
+@receiver(m2m_changed, sender=get_user_model().torrents.through)
+@receiver(m2m_changed, sender=get_user_model().files.through)
+def bump_versions(**kwargs):
+    """
+    Bumps version stamps of the users whose torrents or files are linked or un-linked,
+    so conditional requests of their listings don't get 304 (Not Modified).
+    """
+    action, pk_set = kwargs['action'], kwargs['pk_set']
+    changed = action in ('post_add', 'post_remove') and pk_set
+
+    if not kwargs['reverse']:
+        # Torrents or files of the user are changed, e.g. `user.torrents.add(torrent)`.
+        if changed or action == 'post_clear':
+            bump_user_versions_on_commit([kwargs['instance'].pk])
+    elif changed:
+        # Users of the torrent or file are changed, e.g. `torrent.user_set.add(user)`.
+        bump_user_versions_on_commit(pk_set)
+    elif action == 'pre_clear':
+        # Users of the torrent or file are about to be un-linked, e.g. `torrent.user_set.clear()`.
+        bump_user_versions_on_commit(kwargs['instance'].user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(**kwargs):
+    """
+    Invalidates cached user of the token which is rotated or deleted.
+    """
+    invalidate_token(kwargs['instance'].key)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_cached_tokens(**kwargs):
+    """
+    Invalidates cached users of the tokens of the changed user (e.g. deactivated).
+    """
+    if not kwargs['created']:
+        for key in Token.objects.filter(user=kwargs['instance']).values_list('key', flat=True):
+            invalidate_token(key)
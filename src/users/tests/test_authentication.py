@@ -0,0 +1,66 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.exceptions import AuthenticationFailed
+
+from ..authentication import CachedTokenAuthentication, LRUCache, token_cache, TOKEN_CACHE_SIZE, TOKEN_CACHE_TIMEOUT
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """
+    Unit tests for cached token authentication.
+    """
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('johndoe', 'john@doe.com', 'johndoe')
+        self.key = self.user.auth_token.key
+        self.authentication = CachedTokenAuthentication()
+
+    def test_authenticate_credentials_that_do_not_query_cached_tokens(self):
+        self.authentication.authenticate_credentials(self.key)
+
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(self.key)
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.username, self.user.username)
+        self.assertEqual(token.key, self.key)
+
+        # In-process cache is backed by redis.
+        token_cache.clear()
+
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(self.key)
+
+        self.assertEqual(user.email, self.user.email)
+
+    def test_authenticate_credentials_that_fail_after_token_is_deleted(self):
+        self.authentication.authenticate_credentials(self.key)
+        self.user.auth_token.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.key)
+
+    def test_authenticate_credentials_that_fail_after_token_is_deleted_by_another_process(self):
+        other_cache = LRUCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TIMEOUT)
+
+        with patch('users.authentication.token_cache', other_cache):
+            self.authentication.authenticate_credentials(self.key)
+
+        # Signal of this process can't reach the in-process cache of the other one.
+        self.user.auth_token.delete()
+        self.assertIsNotNone(other_cache.get(self.key))
+
+        with patch('users.authentication.token_cache', other_cache):
+            with self.assertRaises(AuthenticationFailed):
+                self.authentication.authenticate_credentials(self.key)
+
+        self.assertIsNone(other_cache.get(self.key))
+
+    def test_authenticate_credentials_that_fail_after_user_is_deactivated(self):
+        self.authentication.authenticate_credentials(self.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.key)